@@ -0,0 +1,147 @@
+"""
+Benchmarks of the BNC575 driver against the local simulator
+
+Measures the command round trip of Device.send, the BNC575.output() full refresh, the move_abs
+rate of the actuator plugin and the cost of a reconnection, and writes the results as JSON::
+
+    python benchmarks/bench_bnc575.py --latency 0.0005 --output results.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from pymodaq_plugins_bnc import __version__
+from pymodaq_plugins_bnc.hardware.bnc_commands import BNC575
+from pymodaq_plugins_bnc.hardware.registers import initial_state
+from pymodaq_plugins_bnc.hardware.simulator import BNC575Simulator
+
+
+_app = None
+
+
+def summarize(samples):
+    """Statistics of a list of durations in seconds, reported in milliseconds"""
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1e3,
+        'median_ms': statistics.median(ordered) * 1e3,
+        'p95_ms': ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)] * 1e3,
+        'min_ms': ordered[0] * 1e3,
+        'max_ms': ordered[-1] * 1e3,
+    }
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_send(bnc, repeat):
+    return summarize(timed(lambda: bnc.send("*IDN?"), repeat))
+
+
+def bench_output(bnc, repeat):
+    return summarize(timed(bnc.output, repeat))
+
+
+def bench_move_abs(bnc, repeat):
+    """move_abs of the actuator plugin followed by the position read PyMoDAQ does after each move"""
+    from qtpy.QtWidgets import QApplication
+    from pymodaq.utils.data import DataActuator
+    from pymodaq_plugins_bnc.daq_move_plugins.daq_move_bnc import DAQ_Move_bnc
+
+    global _app
+    _app = QApplication.instance() or QApplication(sys.argv)  # kept alive for the whole run
+    plugin = DAQ_Move_bnc(None, None)
+    # set up as ini_stage does, on the controller of the benchmark
+    plugin.controller = bnc
+    plugin.settings.addChildren(bnc.output(initial_state()))
+    plugin._connect()
+    targets = [DataActuator(data=float(index % 100)) for index in range(repeat)]
+
+    def move(target=iter(targets)):
+        plugin.move_abs(next(target))
+        plugin.get_actuator_value()
+
+    try:
+        samples = timed(move, repeat)
+    finally:
+        plugin.poller.stop()
+        plugin._writer.close()
+    result = summarize(samples)
+    result['points_per_s'] = len(samples) / sum(samples)
+    return result
+
+
+def bench_reconnect(bnc, repeat):
+    def reconnect():
+        bnc.reconnect()
+        bnc.send("*IDN?")
+    return summarize(timed(reconnect, repeat))
+
+
+BENCHMARKS = {
+    'send_round_trip': bench_send,
+    'output_refresh': bench_output,
+    'move_abs': bench_move_abs,
+    'reconnect': bench_reconnect,
+}
+
+
+def run(latency=0.0, jitter=0.0, repeat=200, selected=None):
+    results = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'version': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'simulator': {'latency_s': latency, 'jitter_s': jitter},
+        'repeat': repeat,
+        'benchmarks': {},
+    }
+    # the plugin prints its status messages when it has no parent, keep them out of the JSON
+    with BNC575Simulator(latency=latency, jitter=jitter, seed=0) as simulator, \
+            contextlib.redirect_stdout(sys.stderr):
+        bnc = BNC575(*simulator.address)
+        try:
+            for name, benchmark in BENCHMARKS.items():
+                if selected and name not in selected:
+                    continue
+                results['benchmarks'][name] = benchmark(bnc, repeat)
+        finally:
+            bnc.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the BNC575 driver against the simulator")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated reply delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="simulated random extra delay in seconds")
+    parser.add_argument("--repeat", type=int, default=200, help="samples per benchmark")
+    parser.add_argument("--only", nargs="*", choices=list(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument("--output", default=None, help="JSON file to write, stdout by default")
+    args = parser.parse_args()
+
+    results = run(args.latency, args.jitter, args.repeat, args.only)
+    text = json.dumps(results, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w') as file:
+            file.write(text)
+
+
+if __name__ == '__main__':
+    main()
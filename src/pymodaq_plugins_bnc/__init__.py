@@ -1,8 +1,18 @@
 from pathlib import Path
-from pymodaq.utils.logger import set_logger  # to be imported by other modules.
-
-from .utils import Config
-config = Config()
 
 with open(str(Path(__file__).parent.joinpath('resources/VERSION')), 'r') as fvers:
     __version__ = fvers.read().strip()
+
+
+def __getattr__(name):
+    """Load the PyMoDAQ dependent attributes on first use, so that the hardware package can be imported
+    without PyMoDAQ and Qt"""
+    global Config, config, set_logger
+    if name == 'set_logger':
+        from pymodaq.utils.logger import set_logger  # to be imported by other modules.
+        return set_logger
+    if name in ('Config', 'config'):
+        from .utils import Config
+        config = Config()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
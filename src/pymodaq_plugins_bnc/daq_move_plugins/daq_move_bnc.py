@@ -2,8 +2,17 @@ from pymodaq.control_modules.move_utility_classes import DAQ_Move_base, comon_pa
     DataActuator  # common set of parameters for all actuators
 from pymodaq.utils.daq_utils import ThreadCommand # object used to send info back to the main thread
 from pymodaq.utils.parameter import Parameter
+from pymodaq_plugins_bnc import config
 from pymodaq_plugins_bnc.hardware.bnc_commands import BNC575
+from pymodaq_plugins_bnc.hardware.debounce import DebouncedWriter
+from pymodaq_plugins_bnc.hardware.framing import DeviceError
+from pymodaq_plugins_bnc.hardware.group import BNC575Group
+from pymodaq_plugins_bnc.hardware.poller import StatePoller
+from pymodaq_plugins_bnc.hardware.profiles import load_profile, profile_names, save_profile
+from pymodaq_plugins_bnc.hardware.registers import REGISTERS, RESOLUTION, SETTINGS, initial_state
+from pymodaq_plugins_bnc.hardware.trajectory import Trajectory
 from qtpy import QtCore
+import threading
 from typing import Union, List, Dict, Tuple
 
 
@@ -13,19 +22,105 @@ class DAQ_Move_bnc(DAQ_Move_base):
         * Tested on PyMoDAQ 4.1.1
         * Tested on Python 3.8.18
         * No additional drivers necessary
+        * Axes are the delays and widths of channels A to D, all slaves share the master's connection
+          and concurrent moves of several axes are sent as a single write
+        * Additional units listed in the configuration form a timing group with the first one, each axis
+          drives the unit chosen in its Timing Group settings and moves of different units run in parallel
 
     """
-    is_multiaxes = False
-    _axis_names: Union[List[str], Dict[str, int]] = ['Delay']
+    is_multiaxes = True
+    _axis_names: Union[List[str], Dict[str, int]] = {'Delay A': 1, 'Delay B': 2, 'Delay C': 3, 'Delay D': 4,
+                                                     'Width A': 5, 'Width B': 6, 'Width C': 7, 'Width D': 8}
     _controller_units: Union[str, List[str]] = 'ns'
-    _epsilon = 0.25
+    _epsilon = RESOLUTION * 1e9  # timing resolution of the instrument in ns
+    _home_values = {'delay': 0.0, 'width': 10e-9}
     data_actuator_type = DataActuatorType.DataActuator
-
-    params = comon_parameters_fun(is_multiaxes, axis_names=_axis_names, epsilon=_epsilon)
+    state_read = QtCore.Signal(dict)  # first state read in the background by ini_stage
+    writes_pending = QtCore.Signal(bool)
+    settings_written = QtCore.Signal(dict, dict)
+    point_acknowledged = QtCore.Signal(bool)  # acknowledgement of a streamed move
+    # Settings written through the debounced writer, so that dragging their spinbox only writes the final value
+    _debounced = ('delay', 'width', 'amplitude', 'period', 'trig_thresh', 'gate_thresh')
+
+    params = comon_parameters_fun(is_multiaxes, axis_names=_axis_names, epsilon=_epsilon) + [
+        {'title': 'Timing Group', 'name': 'timing_group', 'type': 'group', 'children': [
+            {'title': 'Unit', 'name': 'unit', 'type': 'int', 'value': 0, 'min': 0,
+             'tip': 'Index of the unit driven by this axis: 0 for the unit of the bnc575 configuration section, '
+                    'then the additional units in the order of its units entry'},
+            {'title': 'Units in Group', 'name': 'units', 'type': 'int', 'value': 1, 'readonly': True},
+        ]},
+        {'title': 'Move Completion', 'name': 'move_completion', 'type': 'group', 'children': [
+            {'title': 'Position From', 'name': 'completion_mode', 'type': 'list', 'value': 'Acknowledged',
+             'limits': ['Acknowledged', 'Readback'],
+             'tip': 'Acknowledged: a move is done when the instrument acknowledges the write and the position is '
+                    'the commanded value at the instrument resolution. Readback: the position is queried after '
+                    'every move'},
+            {'title': 'Verify Every', 'name': 'verify_every', 'type': 'int', 'value': 0, 'min': 0,
+             'tip': 'In Acknowledged mode, read the position back every N moves (0: only after a failed write)'},
+            {'title': 'Stream Writes?', 'name': 'stream_writes', 'type': 'bool', 'value': False,
+             'tip': 'Return from moves without waiting for the instrument: the move is done as soon as its '
+                    'acknowledgement arrives, and errors are collected in the background'},
+        ]},
+        {'title': 'Scan Table', 'name': 'scan_table', 'type': 'group', 'children': [
+            {'title': 'Use Scan Table?', 'name': 'table_enabled', 'type': 'bool', 'value': False,
+             'tip': 'Moves to a point of the loaded table send its pre-rendered write and report the position '
+                    'from the table index instead of reading it back'},
+            {'title': 'Start (ns)', 'name': 'table_start', 'type': 'float', 'value': 0.0, 'min': 0.0},
+            {'title': 'Stop (ns)', 'name': 'table_stop', 'type': 'float', 'value': 100.0, 'min': 0.0},
+            {'title': 'Spacing', 'name': 'table_spacing', 'type': 'list', 'value': 'Linear', 'limits': ['Linear', 'Log']},
+            {'title': 'Step (ns)', 'name': 'table_step', 'type': 'float', 'value': 1.0, 'min': _epsilon,
+             'tip': 'Step of a linear table'},
+            {'title': 'Log Points', 'name': 'table_count', 'type': 'int', 'value': 50, 'min': 2,
+             'tip': 'Number of points of a log table, whose start must be above 0'},
+            {'title': 'Within Period?', 'name': 'table_constrained', 'type': 'bool', 'value': True,
+             'tip': 'Clamp the delays so that the pulses end within the current period'},
+            {'title': 'Software Trigger?', 'name': 'table_trigger', 'type': 'bool', 'value': False,
+             'tip': 'Send a *TRG together with each point instead of waiting for an external trigger'},
+            {'title': 'Load Table', 'name': 'table_load', 'type': 'bool_push', 'label': 'Load', 'value': False},
+            {'title': 'Points', 'name': 'table_points', 'type': 'int', 'value': 0, 'readonly': True},
+        ]},
+        {'title': 'Profiles', 'name': 'profiles', 'type': 'group', 'expanded': False, 'children': [
+            {'title': 'Profile', 'name': 'profile', 'type': 'list', 'value': '', 'limits': profile_names(config),
+             'tip': 'Configuration of every channel saved in the plugin configuration file'},
+            {'title': 'Apply Profile', 'name': 'profile_apply', 'type': 'bool_push', 'label': 'Apply', 'value': False,
+             'tip': 'Write in one batch the registers whose value differs from the selected profile'},
+            {'title': 'New Profile Name', 'name': 'profile_name', 'type': 'str', 'value': ''},
+            {'title': 'Save Profile', 'name': 'profile_save', 'type': 'bool_push', 'label': 'Save', 'value': False,
+             'tip': 'Save the current configuration of every channel under the new profile name'},
+        ]},
+        {'title': 'Polling', 'name': 'polling', 'type': 'group', 'expanded': False, 'children': [
+            {'title': 'Poll Device State?', 'name': 'poll_enabled', 'type': 'bool', 'value': False,
+             'tip': 'Sample the selected settings in the background and show changes made on the front panel. '
+                    'Sampling waits while moves are in progress'},
+            {'title': 'Interval (s)', 'name': 'poll_interval', 'type': 'float', 'value': 1.0, 'min': 0.05},
+            {'title': 'Polled Settings', 'name': 'poll_settings', 'type': 'itemselect',
+             'value': dict(all_items=[name for name in SETTINGS if name != 'id'],
+                           selected=['global_state', 'channel_state', 'trig_mode', 'delay', 'width'])},
+        ]},
+        {'title': 'Diagnostics', 'name': 'diagnostics', 'type': 'group', 'expanded': False, 'children': [
+            {'title': 'Collect Metrics?', 'name': 'metrics_enabled', 'type': 'bool', 'value': False,
+             'tip': 'Time every exchange with the instrument and count retries, reconnects and timeouts'},
+            {'title': 'Trace Size', 'name': 'trace_size', 'type': 'int', 'value': 100, 'min': 0,
+             'tip': 'Number of most recent exchanges kept in the trace'},
+            {'title': 'Update Report', 'name': 'metrics_update', 'type': 'bool_push', 'label': 'Update', 'value': False},
+            {'title': 'Reset Metrics', 'name': 'metrics_reset', 'type': 'bool_push', 'label': 'Reset', 'value': False},
+            {'title': 'Report', 'name': 'metrics_report', 'type': 'text', 'value': '', 'readonly': True},
+        ]}
+    ]
 
     def ini_attributes(self):
         self.controller: BNC575 = None
         self.attributes = None
+        self._param_paths = {}
+        self.poller: StatePoller = None
+        self._unverified_moves = 0
+        self._verify_next = False
+        self._writer: DebouncedWriter = None
+        self._streamed_moves = 0
+        self.point_acknowledged.connect(self._on_point_acknowledged)
+        self.state_read.connect(self.update_state)
+        self.writes_pending.connect(self._on_writes_pending)
+        self.settings_written.connect(self._on_settings_written)
 
     def get_actuator_value(self):
         """Get the current value from the hardware with scaling conversion.
@@ -34,14 +129,22 @@ class DAQ_Move_bnc(DAQ_Move_base):
         -------
         float: The delay obtained after scaling conversion.
         """
-        delay = DataActuator(data=self.controller.delay*1e9)
-
-        return delay
+        verify, self._verify_next = self._verify_next, False
+        table = self._active_scan_table()
+        if table is not None and table.position is not None and not verify:
+            return DataActuator(data=table.position * 1e9)
+        channel, register = self._axis_register()
+        value = DataActuator(data=self.controller.channel_value(channel, register, verify)*1e9)
+
+        return value
     
     def user_condition_to_reach_target(self) -> bool:
         """ Implement a condition for exiting the polling mechanism and specifying that the
         target value has been reached
 
+        The delays settle as soon as the instrument acknowledges the write, which move_abs waits for, so
+        the target is reached once the position read by get_actuator_value is within epsilon.
+
        Returns
         -------
         bool: if True, PyMoDAQ considers the target value has been reached
@@ -50,13 +153,45 @@ class DAQ_Move_bnc(DAQ_Move_base):
 
     def close(self):
         """Terminate the communication protocol"""
-        self.controller.close()
+        if self.poller is not None:
+            self.poller.stop()
+            self.poller = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._barrier()
+        if self.controller.group is None:
+            self.controller.close()
+        elif self.is_master:
+            self.controller.group.close()
+
+    def refresh(self, names=None):
+        """Read the given settings from the device and push the values that changed to the UI
 
-    def get_config(self):
-        """Get current parameters and update their values in the UI"""
-        self.attributes = self.controller.output()
-        self.update_params_ui()
+        Parameters
+        ----------
+        names: iterable of str or None
+            Names of the settings to refresh (see BNC575.read_state), all of them by default
+        """
+        self.update_state(self.controller.read_state(names))
+
+    def update_state(self, state):
+        """Push the values of a BNC575.read_state() dictionary that differ from the UI
 
+        Settings with a pending write keep the value entered by the user.
+        """
+        pending = {name for name, _ in self._writer.pending} if self._writer is not None else set()
+        state = {name: value * REGISTERS[SETTINGS[name][1]].scale if isinstance(value, float) else value
+                 for name, value in state.items() if name not in pending}
+        if 'period' in state:
+            state['rep_rate'] = 1.0 / state['period']
+        for name, value in state.items():
+            path = self._param_paths.get(name)
+            if path is None:
+                continue
+            param = self.settings.child(*path)
+            if param.value() != value:
+                param.setValue(value)
 
     def commit_settings(self, param: Parameter):
         """Apply the consequences of a change of value in the detector settings
@@ -66,16 +201,12 @@ class DAQ_Move_bnc(DAQ_Move_base):
         param: Parameter
             A given parameter (within detector_settings) whose value has been changed by the user
         """
-        if param.name() == "ip":
-            port = self.controller.port
-            self.close()
-            self.controller = self.ini_stage_init(old_controller=None,
-                                              new_controller=BNC575(param.value(), port))
-        if param.name() == "port":
-            ip = self.controller.ip
+        if param.name() in ("ip", "port"):
+            address = {'ip': self.controller.ip, 'port': self.controller.port, param.name(): param.value()}
             self.close()
-            self.controller = self.ini_stage_init(old_controller=None,
-                                              new_controller=BNC575(ip, param.value()))
+            group = BNC575Group([(address['ip'], address['port'])], background_connect=True)
+            self.ini_stage_init(old_controller=None, new_controller=group.master)
+            self._connect()
         elif param.name() == "label":
             self.controller.label = param.value()
         elif param.name() == "slot":
@@ -86,11 +217,44 @@ class DAQ_Move_bnc(DAQ_Move_base):
         elif param.name() == "restore":
             if param.value:
                 self.controller.restore_state()
-                self.get_config()
+                self.refresh()
         elif param.name() == "reset":
             if param.value:
                 self.controller.reset()
-                self.get_config()
+                self.refresh()
+        elif param.name() == "table_load":
+            if param.value():
+                self.load_scan_table()
+        elif param.name() == "stream_writes":
+            if not param.value():
+                self._barrier()
+        elif param.name() == "table_enabled":
+            if self.controller.scan_table is not None:
+                self.controller.scan_table.reset()
+        elif param.name() in ("metrics_enabled", "trace_size"):
+            if self.settings['diagnostics', 'metrics_enabled']:
+                self.controller.enable_metrics(self.settings['diagnostics', 'trace_size'])
+            else:
+                self.controller.disable_metrics()
+        elif param.name() == "metrics_update":
+            if param.value():
+                self.update_metrics_report()
+        elif param.name() == "metrics_reset":
+            if param.value() and self.controller.metrics is not None:
+                self.controller.metrics.reset()
+                self.update_metrics_report()
+        elif param.name() == "profile_apply":
+            if param.value() and self.settings['profiles', 'profile']:
+                self.apply_profile(self.settings['profiles', 'profile'])
+        elif param.name() == "profile_save":
+            if param.value() and self.settings['profiles', 'profile_name']:
+                self.save_profile(self.settings['profiles', 'profile_name'])
+        elif param.name() in ("poll_enabled", "poll_interval", "poll_settings"):
+            self.update_poller()
+        elif param.name() == "trust_cache":
+            self.controller.trust_cache = param.value()
+        elif param.name() == "cache_ttl":
+            self.controller.cache.ttl = param.value() if param.value() > 0 else None
         elif param.name() == "global_state":
             if param.value():
                 self.controller.global_state = "ON"
@@ -107,37 +271,26 @@ class DAQ_Move_bnc(DAQ_Move_base):
             self.controller.channel_mode = param.value()
         elif param.name() == "channel_label":
            self.controller.channel_label = param.value()
-           self.get_config()
-        elif param.name() == "delay":
-            self.controller.delay = param.value() * 1e-9
-            self.get_actuator_value()
-        elif param.name() == "width":
-            self.controller.width = param.value() * 1e-9
+           self.refresh(BNC575.CHANNEL_SETTINGS)
+        elif param.name() in self._debounced:
+            self.write_setting(param.name(), param.value())
         elif param.name() == "amplitude_mode":
             self.controller.amplitude_mode = param.value()
-        elif param.name() == "amplitude":
-            self.controller.amplitude = param.value()
         elif param.name() == "polarity":
             self.controller.polarity = param.value()
-        elif param.name() == "period":
-            self.controller.period = param.value()
-            self.settings.child('continuous_mode',  'rep_rate').setValue(1 / self.controller.period)
         elif param.name() == "rep_rate":
-            self.controller.period(1 / param.value())
+            self._discard([('period', 0)])
+            self.controller.transaction({'rep_rate': param.value()})
             self.settings.child('continuous_mode',  'period').setValue(self.controller.period)
         elif param.name() == "trig_mode":
             self.controller.trig_mode = param.value()
-        elif param.name() == "trig_thresh":
-            self.controller.trig_thresh = param.value()
         elif param.name() == "trig_edge":
             self.controller.trig_edge = param.value()
         elif param.name() == "gate_mode":
             self.controller.gate_mode = param.value()
         elif param.name() == "channel_gate_mode":
             self.controller.channel_gate_mode = param.value()
-            self.settings.child('gating',  'gate_mode').setValue(self.controller.get_gate_mode())
-        elif param.name() == "gate_thresh":
-            self.controller.gate_thresh = param.value()
+            self.refresh(('gate_mode',))
         elif param.name() == "gate_logic":            
             self.controller.gate_logic = param.value()
 
@@ -159,35 +312,58 @@ class DAQ_Move_bnc(DAQ_Move_base):
         self.ini_stage_init(slave_controller=controller)  # will be useful when controller is slave
 
         if self.is_master:  # is needed when controller is master
-            self.controller = BNC575("192.168.178.146", 2001)
-            
-        # Give a bit of time for device connection to be established
-        QtCore.QThread.msleep(50)
-
-        # Update UI with relevant parameters & their current values
-        self.attributes = self.controller.output()
+            group = BNC575Group.from_config(config, background_connect=True)
+        else:
+            group = self.controller.group
+        if group is not None:
+            self.controller = group[min(self.settings['timing_group', 'unit'], len(group) - 1)]
+            self.settings.child('timing_group', 'units').setValue(len(group))
+
+        # Build the settings tree at once with placeholder values, the instrument state is read in the background.
+        # The tree and its limits are built once.
+        self.attributes = self.controller.output(initial_state())
+        self._param_paths = {child['name']: (group['name'], child['name'])
+                             for group in self.attributes for child in group['children']}
         try:
             self.settings.addChildren(self.attributes)
         except ValueError:
-            pass # dictionary has already been added
-        self.update_params_ui()
-        self.settings.child('bounds').hide()
+            pass  # parameters already added by a previous initialization, refreshed by the read below
         self.settings.child('scaling').hide()
         self.settings.child('units').hide()
-        self.settings.child('epsilon').hide()
+        low, high = REGISTERS[self._axis_register()[1]].limits
+        self.settings.child('bounds', 'min_bound').setValue(low * 1e9)
+        self.settings.child('bounds', 'max_bound').setValue(high * 1e9)
         
+        self._connect()
+
+        info = "Device initialized successfully"
+        initialized = True
+        return info, initialized
+
+
+    def _connect(self):
+        """Start driving the controller once the settings tree is built, at initialization or after a change of
+        address: read its state in the background, set up the debounced writer and, for the master, the poller"""
         # Initialize device state
         self.settings.child('connection',  'ip').setValue(self.controller.ip)
         self.settings.child('connection',  'port').setValue(self.controller.port)
-        self.controller.restore_state()
+        group = self.controller.group
+        units = list(group) if self.is_master and group is not None else []
+        threading.Thread(target=self._read_first_state, args=(units,),
+                         name="BNC575 first state read", daemon=True).start()
+
+        self._writer = DebouncedWriter(self.controller.write_registers)
+        self._writer.hooks.append(self._on_writer_event)
 
         # Connect still communicating signal
         self.controller.listener.still_communicating.connect(lambda still_communicating: self._on_device_communication_state_change(still_communicating))
 
-        info = "Device initialized successfully"
-        initialized = True
-        return info, initialized
-
+        # Background polling of the device state, done by the master for the controller it owns
+        if self.is_master:
+            self.poller = StatePoller(self.controller, ())
+            self.poller.listener.state_changed.connect(self.update_state)
+            self.poller.listener.reachable.connect(self._on_device_reachable_change)
+            self.update_poller()
 
     def move_abs(self, value: DataActuator):
         """ Move the actuator to the absolute target defined by value
@@ -198,7 +374,7 @@ class DAQ_Move_bnc(DAQ_Move_base):
         value = self.check_bound(value)  #if user checked bounds, the defined bounds are applied here
         self.target_value = value
         value = self.set_position_with_scaling(value)  # apply scaling if the user specified one
-        self.controller.delay = (self.target_value).value() * 1e-9
+        self._start_move(self.target_value.value())
 
     def move_rel(self, value: DataActuator):
         """ Move the actuator to the relative target actuator value defined by value
@@ -209,72 +385,231 @@ class DAQ_Move_bnc(DAQ_Move_base):
         value = self.check_bound(self.current_position + value) - self.current_position
         self.target_value = value + self.current_position
         value = self.set_position_relative_with_scaling(value)
-        self.controller.delay = (self.target_value).value() * 1e-9
+        self._start_move(self.target_value.value())
         self.emit_status(ThreadCommand('Update_Status', ['Moving delay by: {}'.format(value.value())]))
 
     def move_home(self):
         """Call the reference method of the controller"""
-        self.controller.delay = 0
-        self.emit_status(ThreadCommand('Update_Status', ['Moving to zero position']))
+        channel, register = self._axis_register()
+        self._discard([(register, channel)])
+        self._moved(self.controller.move(channel, register, self._home_values[register]))
+        self.emit_status(ThreadCommand('Update_Status', ['Moving to home position']))
         self.poll_moving()
 
+    def poll_moving(self):
+        """Poll the move, unless streamed writes are in flight: their acknowledgement completes the move"""
+        if self._streamed_moves:
+            return
+        super().poll_moving()
+
     def stop_motion(self):
       """Stop the actuator and emits move_done signal"""
+      self._barrier()
       self.move_done()
       self.poll_moving()
 
+    def write_setting(self, name, value):
+        """Queue the write of a setting (see _debounced) from its value in the plugin units
+
+        Writes are coalesced by the debounced writer, the Writes Pending led is lit until they are done.
+        """
+        register = REGISTERS[name]
+        if name == 'amplitude' and self.controller.amplitude_mode != "ADJ":
+            raise ValueError("In TTL mode. Switch to ADJ mode before setting amplitude.")
+        channel = self.controller.set_channel() if register.scope == 'channel' else 0
+        if self._writer is None:
+            self.controller.write_registers({(name, channel): value / register.scale})
+        else:
+            self._writer.submit((name, channel), value / register.scale)
+        if name == 'period':
+            self.settings.child('continuous_mode', 'rep_rate').setValue(1 / value)
+
+    def load_scan_table(self):
+        """Build the scan table of the current axis channel from the Scan Table settings"""
+        start = self.settings['scan_table', 'table_start'] * 1e-9
+        stop = self.settings['scan_table', 'table_stop'] * 1e-9
+        channel = self._axis_register()[0]
+        constraints = {}
+        if self.settings['scan_table', 'table_constrained']:
+            constraints = dict(period=self.controller.period, widths=self.controller.channel_value(channel, 'width'))
+        if self.settings['scan_table', 'table_spacing'] == 'Log':
+            trajectory = Trajectory.log(start, stop, self.settings['scan_table', 'table_count'], channel, **constraints)
+        else:
+            trajectory = Trajectory.linear(start, stop, self.settings['scan_table', 'table_step'] * 1e-9, channel,
+                                           **constraints)
+        try:
+            table = self.controller.load_scan_table(trajectory)
+        except ValueError as e:
+            self.settings.child('scan_table', 'table_points').setValue(0)
+            self.emit_status(ThreadCommand('Update_Status', [f'Scan table rejected: {e}', 'log']))
+            return
+        self.settings.child('scan_table', 'table_points').setValue(len(table))
+        self.emit_status(ThreadCommand('Update_Status', [
+            f'Scan table loaded with {len(table)} points ({trajectory.clamped} clamped, '
+            f'{trajectory.merged} merged at the {RESOLUTION * 1e9} ns resolution)']))
+
+    def apply_profile(self, name):
+        """Apply a profile of the plugin configuration, writing only the registers that differ"""
+        acks = self.controller.apply_profile(load_profile(config, name))
+        self.refresh()
+        failed = [path for path, ack in acks.items() if not ack]
+        self.emit_status(ThreadCommand('Update_Status', [
+            f'Profile {name} applied, {len(acks)} registers written' +
+            (f', rejected: {", ".join(failed)}' if failed else '')]))
+
+    def save_profile(self, name):
+        """Save the current configuration of every channel as a profile of the plugin configuration"""
+        save_profile(config, name, self.controller.capture_profile())
+        self.settings.child('profiles', 'profile').setLimits(profile_names(config))
+        self.settings.child('profiles', 'profile').setValue(name)
+        self.emit_status(ThreadCommand('Update_Status', [f'Profile {name} saved']))
+
+    def update_metrics_report(self):
+        """Show the timing metrics and the last traced exchanges in the Diagnostics group"""
+        metrics = self.controller.metrics
+        if metrics is None:
+            report = 'Metrics collection is disabled'
+        else:
+            report = metrics.report()
+            if metrics.trace:
+                report += '\n\nLast exchanges (ms):\n' + '\n'.join(
+                    f'{duration * 1e3:8.3f}  {msg} -> {reply}' for _, msg, reply, duration in list(metrics.trace)[-20:])
+        self.settings.child('diagnostics', 'metrics_report').setValue(report)
+
+    def update_poller(self):
+        """Apply the Polling settings to the state poller, starting or stopping it"""
+        if self.poller is None:
+            return
+        self.poller.interval = self.settings['polling', 'poll_interval']
+        self.poller.names = tuple(self.settings['polling', 'poll_settings']['selected'])
+        if self.settings['polling', 'poll_enabled'] and self.poller.names:
+            self.poller.start()
+        else:
+            self.poller.stop()
+
+    def _moved(self, acknowledged):
+        """Decide whether the position following a move is read back or taken from the acknowledged write"""
+        self._unverified_moves += 1
+        every = self.settings['move_completion', 'verify_every']
+        if (not acknowledged or self.settings['move_completion', 'completion_mode'] == 'Readback'
+                or every and self._unverified_moves >= every):
+            self._verify_next = True
+            self._unverified_moves = 0
+        if not acknowledged:
+            self.emit_status(ThreadCommand('Update_Status', ['Move not acknowledged, reading the position back']))
+
+    def _start_move(self, target):
+        """Move the axis to target (in ns), streaming the write if Stream Writes is on"""
+        if not self.settings['move_completion', 'stream_writes']:
+            self._moved(self._move_axis(target))
+            return
+        channel, register = self._axis_register()
+        self._discard([(register, channel)])
+        self._streamed_moves += 1
+        try:
+            index = self._table_point(target)
+            if index is not None:
+                self.controller.step_nowait(index, self.settings['scan_table', 'table_trigger'],
+                                            self.point_acknowledged.emit)
+            else:
+                self.controller.move_nowait(channel, register, target * 1e-9, self.point_acknowledged.emit)
+        except Exception:
+            self._streamed_moves -= 1
+            raise
+
+    def _move_axis(self, target):
+        """Move the axis to target (in ns), superseding a pending write of its register from the settings"""
+        channel, register = self._axis_register()
+        self._discard([(register, channel)])
+        return self._step_scan_table(target) or self.controller.move(channel, register, target * 1e-9)
+
+    def _discard(self, keys):
+        """Drop the pending writes of the settings keyed by (name, channel), superseded by a move"""
+        if self._writer is not None:
+            self._writer.discard(keys)
+
+    def _axis_register(self):
+        """Channel number and register moved by the current axis"""
+        index = self.axis_value
+        return (index - 1) % 4 + 1, 'delay' if index <= 4 else 'width'
+
+    def _active_scan_table(self):
+        table = self.controller.scan_table
+        if table is None or not self.settings['scan_table', 'table_enabled']:
+            return None
+        if self._axis_register() != (table.channel, 'delay'):
+            return None
+        return table
+
+    def _table_point(self, target):
+        """Index of the point of the active scan table matching target (in ns), None if there is none"""
+        table = self._active_scan_table()
+        if table is None:
+            return None
+        index = table.lookup(target * 1e-9, self.settings['epsilon'] * 1e-9)
+        if index is None:
+            table.reset()
+        return index
+
+    def _step_scan_table(self, target):
+        """Arm the scan table point matching target (in ns), return False if there is none"""
+        index = self._table_point(target)
+        return index is not None and self.controller.step(index, self.settings['scan_table', 'table_trigger'])
+
+    def _on_point_acknowledged(self, acknowledged):
+        """Complete a streamed move once the instrument replied, unless a later move is already in flight"""
+        self._streamed_moves -= 1
+        self._moved(acknowledged)
+        if self._streamed_moves:
+            return
+        self.poll_timer.stop()
+        self.move_done()
+
+    def _barrier(self):
+        """Wait for the streamed writes and report the errors collected meanwhile"""
+        try:
+            self.controller.barrier()
+        except (DeviceError, ConnectionError, TimeoutError) as e:
+            self.emit_status(ThreadCommand('Update_Status', [f'Streamed write failed: {e}', 'log']))
+
+    def _read_first_state(self, units):
+        """Wait for the connection, restore the state of the given units and show the instrument state"""
+        try:
+            for unit in units:
+                unit.restore_state()
+            self.state_read.emit(self.controller.read_state())
+        except (ConnectionError, OSError) as e:
+            self.emit_status(ThreadCommand('Update_Status', [f'Could not read the device state: {e}', 'log']))
+
+    def _on_writer_event(self, event, *args):
+        """Hook of the debounced writer, forwarded to the plugin thread"""
+        if event == 'pending':
+            self.writes_pending.emit(*args)
+        elif event == 'written':
+            self.settings_written.emit(*args)
+
+    def _on_writes_pending(self, pending):
+        self.settings.child('connection', 'writes_pending').setValue(pending)
+
+    def _on_settings_written(self, values, acks):
+        """Show the device value of the settings whose write was rejected"""
+        rejected = [(name, channel) for name, channel in values if not acks.get((name, channel))]
+        if not rejected:
+            return
+        self.emit_status(ThreadCommand('Update_Status', [
+            f'Device rejected {", ".join(name for name, _ in rejected)}, showing its value again', 'log']))
+        shown = [name for name, channel in rejected if channel in (0, self.controller.set_channel())]
+        if shown:
+            self.refresh(shown)
+
     def _on_device_communication_state_change(self, still_communicating):
         param = self.settings.child('connection', 'still_communicating')
         param.setValue(still_communicating)
         param.sigValueChanged.emit(param, still_communicating)
 
-    def update_params_ui(self):
-        # Update UI with current parameter values
-        for param in self.attributes:
-            param_type = param['type']
-            param_name = param['name']
-            
-            if param_type == 'group':
-                # Recurse over children in groups
-                for child in param['children']:
-                    child_name = child['name']
-                    try:
-                        value = child['value']
-                    except Exception as e:
-                        continue
-
-                    try:
-                        # Set the value
-                        self.settings.child(param_name, child_name).setValue(value)
-
-                        # Set limits if defined
-                        if 'limits' in child and not child.get('readonly', False):
-                            try:
-                                limits = child['limits']
-                                self.settings.child(param_name, child_name).setLimits(limits)
-                            except Exception:
-                                pass
-
-                    except Exception:
-                        pass
-            else:
-                try:
-                    value = param['value']
-                except Exception as e:
-                    continue
-
-                try:
-                    # Set the value
-                    self.settings.param(param_name).setValue(value)
-
-                    if 'limits' in param and not param.get('readonly', False):
-                        try:
-                            limits = param['limits']
-                            self.settings.param(param_name).setLimits(limits)
-                        except Exception:
-                            pass
-                except Exception:
-                    pass
+    def _on_device_reachable_change(self, reachable):
+        status = 'Device answers state polls again' if reachable else 'Device is not answering state polls'
+        self.emit_status(ThreadCommand('Update_Status', [status]))
 
 
 if __name__ == '__main__':
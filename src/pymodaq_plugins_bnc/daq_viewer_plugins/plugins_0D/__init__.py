@@ -3,11 +3,21 @@ from pathlib import Path
 from ... import set_logger
 logger = set_logger('viewer0D_plugins', add_to_console=False)
 
-for path in Path(__file__).parent.iterdir():
+# Plugin modules are imported on first access, e.g. by PyMoDAQ once the user selects the plugin, instead of
+# all of them when the package is imported. PyMoDAQ lists them from the directory of path.
+path = Path(__file__)
+_plugins = sorted(module.stem for module in path.parent.glob('daq_*.py'))
+
+
+def __getattr__(name):
+    if name not in _plugins:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
     try:
-        if '__init__' not in str(path):
-            importlib.import_module('.' + path.stem, __package__)
+        return importlib.import_module('.' + name, __package__)
     except Exception as e:
-        logger.warning("{:} plugin couldn't be loaded due to some missing packages or errors: {:}".format(path.stem, str(e)))
-        pass
+        logger.warning("{:} plugin couldn't be loaded due to some missing packages or errors: {:}".format(name, str(e)))
+        raise
+
 
+def __dir__():
+    return sorted(list(globals()) + _plugins)
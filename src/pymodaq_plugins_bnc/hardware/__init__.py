@@ -0,0 +1,14 @@
+"""
+Driver of the BNC575, usable without PyMoDAQ nor Qt
+
+Nothing in this package imports PyMoDAQ or Qt at import time, so scripts and worker processes can drive
+the instrument headless. The Qt signals of the plugin are only created when first used.
+"""
+import logging
+from pathlib import Path
+
+
+def get_logger(module_file):
+    """Logger of a driver module, a child of the PyMoDAQ logger so that its records reach the PyMoDAQ log
+    when running in PyMoDAQ, without importing PyMoDAQ (see pymodaq.utils.logger.set_logger)"""
+    return logging.getLogger(f"pymodaq.{Path(module_file).stem}")
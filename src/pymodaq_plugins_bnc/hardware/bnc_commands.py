@@ -1,32 +1,86 @@
-import time
-from pymodaq_plugins_bnc.hardware.device import Device
-from qtpy.QtCore import QThread
+import numpy as np
+from pymodaq_plugins_bnc.hardware.device import Device, logger
+from pymodaq_plugins_bnc.hardware.cache import RegisterCache
+from pymodaq_plugins_bnc.hardware.framing import DeviceError, error_for
+from pymodaq_plugins_bnc.hardware.group_commit import GroupCommit
+from pymodaq_plugins_bnc.hardware.profiles import PROFILE_CHANNEL, PROFILE_SYSTEM
+from pymodaq_plugins_bnc.hardware.registers import CHANNELS, CHANNEL_SETTINGS, REGISTERS, SETTINGS
+from pymodaq_plugins_bnc.hardware.scan_table import ScanTable
+from pymodaq_plugins_bnc.hardware.timing import TimingModel
+from pymodaq_plugins_bnc.hardware.trajectory import Trajectory
 
 class BNC575(Device):
+    """BNC575 delay generator
 
-    def __init__(self, ip, port):
-        super().__init__(ip, port)
-        self.channel_label = "A"
+    The registers of the instrument (see registers.REGISTERS) are properties of the controller, e.g.
+    bnc.delay = 10e-9, reading or writing the register of the current channel (see channel_label).
+    Other keyword arguments are passed to Device, e.g. background_connect=True to return before the
+    connection is established.
+    """
+
+    CHANNEL_SETTINGS = CHANNEL_SETTINGS
+
+    def __init__(self, ip, port, trust_cache=True, cache_ttl=None, **kwargs):
+        super().__init__(ip, port, **kwargs)
+        self.cache = RegisterCache(cache_ttl)
+        self.trust_cache = trust_cache
+        self._channel_label = "A"
+        self._channel = 1
         self.slot = 1
-        self.listener.ok_received.connect(self.ok_received)
-        self.received = False
+        self.scan_table = None
+        self.group = None  # BNC575Group this unit belongs to, if any
+        self._moves = GroupCommit(self.write_many)
 
-    def ok_received(self):
-        self.received = True
-    
-    def check_ok(self):
-        start = time.time()
-        while not self.received:
-            QThread.msleep(20)
-            if time.time() - start > 3:  # 3-second timeout
-                print("Timeout waiting for device response")
-                return ''
-        self.received = False
+    def _read(self, path, line=None, verify=False):
+        """Query a register, answering from the cache when it is trusted and holds the value
+
+        line is the precompiled query of the register, see Register.lines. With verify, the register is
+        read back from the instrument anyway and compared with the cached value.
+        """
+        cached = self.cache.get(path)
+        if self.trust_cache and cached is not None and not verify:
+            return cached
+        if line is None:
+            value = self.send_many([path + "?"], strict=True)[0]
+        else:
+            value = self.exchange([line], [path + "?"], strict=True)[0]
+        if cached is not None and not self._same_value(cached, value):
+            self._count('divergences')
+            logger.warning(f"Cached value of {path} ({cached}) differs from the instrument ({value})")
+        if value:
+            self.cache.set(path, value)
+        return value
+
+    def _write(self, path, value, reply=None):
+        """Set a register and write the new value through to the cache
+
+        reply is the form the instrument returns for this value on a query, when it differs from value.
+        Raises the DeviceError of an error reply, e.g. InvalidParameter for a value out of range.
+        """
+        try:
+            answer = self.send_many([f"{path} {value}"], strict=True)[0]
+        except DeviceError:
+            self.cache.invalidate(path)
+            raise
+        if answer == "ok":
+            self.cache.set(path, value if reply is None else reply)
+        else:
+            self.cache.invalidate(path)
+        return answer
+
+    @staticmethod
+    def _same_value(first, second):
+        try:
+            return float(first) == float(second)
+        except ValueError:
+            return first == second
+
+    def invalidate_cache(self):
+        """Forget every cached register, e.g. after the instrument was changed from its front panel"""
+        self.cache.invalidate()
 
     def idn(self):
-        idn = self.query("*IDN").strip()
-        self.check_ok()
-        return idn
+        return self.id
 
     @property
     def ip(self):
@@ -38,7 +92,7 @@ class BNC575(Device):
 
     def reset(self):
         self.send("*RST")
-        self.check_ok()
+        self.cache.invalidate()
 
     def stop(self):
         pass
@@ -53,55 +107,16 @@ class BNC575(Device):
     
     def save_state(self):
         self.set("*SAV", str(self.slot))
-        self.check_ok()
     
     def restore_state(self):
         self.set("*RCL", str(self.slot))
-        self.check_ok()
+        self.cache.invalidate()
     
     def trig(self):
         self.send("*TRG")
-        self.check_ok()
-    
-    @property
-    def label(self):
-        lbl = self.query("*LBL").strip()
-        self.check_ok()
-        return lbl
-    
-    @label.setter
-    def label(self, label):
-        self.set("*LBL", "\"" + label + "\"")
-        self.check_ok()
-        
-    @property
-    def global_state(self):
-        state = self.query(":INST:STATE").strip()
-        self.check_ok()
-        return True if state == "1" else False
-
-    @global_state.setter
-    def global_state(self, state):
-        self.set(":INST:STATE", state)
-        self.check_ok()
-    
-    @property
-    def global_mode(self):
-        mode = self.query(":PULSE0:MODE")
-        self.check_ok()
-        return mode
-    
-    @global_mode.setter
-    def global_mode(self, mode):
-        self.set(":PULSE0:MODE", mode)
-        self.check_ok()
-        
-    def close(self):
-        self.listener.ok_received.disconnect(self.ok_received)
-        self.com.close()
-    
+
     def set_channel(self):
-        return {"A": 1, "B": 2, "C": 3, "D": 4}.get(self.channel_label, 1)
+        return self._channel
 
     @property
     def channel_label(self):
@@ -110,277 +125,541 @@ class BNC575(Device):
     @channel_label.setter
     def channel_label(self, channel_label):
         self._channel_label = channel_label
-        
-    @property
-    def channel_mode(self):
-        channel = self.set_channel()
-        mode = self.query(f":PULSE{channel}:CMOD").strip()
-        self.check_ok()
-        return mode
-
-    @channel_mode.setter
-    def channel_mode(self, mode):
-        channel = self.set_channel()
-        self.set(f":PULSE{channel}:CMOD", mode)
-        self.check_ok()
-        
-    @property
-    def channel_state(self):
-        channel = self.set_channel()
-        state = self.query(f":PULSE{channel}:STATE").strip()
-        self.check_ok()
-        return True if state == "1" else False
-
-    @channel_state.setter    
-    def channel_state(self, state):
-        channel = self.set_channel()
-        self.set(f":PULSE{channel}:STATE", state)
-        self.check_ok()
-
-    @property
-    def trig_mode(self):
-        trig_mode = self.query(":PULSE0:TRIG:MODE").strip()
-        self.check_ok()
-        return trig_mode
-
-    @trig_mode.setter
-    def trig_mode(self, mode):
-        self.set(f":PULSE0:TRIG:MODE", mode)
-        self.check_ok()
-        
-    @property        
-    def trig_thresh(self):
-        thresh = float(self.query(":PULSE0:TRIG:LEV").strip())
-        self.check_ok()
-        return thresh
-    
-    @trig_thresh.setter
-    def trig_thresh(self, thresh):
-        self.set(f":PULSE0:TRIG:LEV", str(thresh))
-        self.check_ok()
-
-    @property
-    def trig_edge(self):
-        edge = self.query(":PULSE0:TRIG:EDGE").strip()
-        self.check_ok()
-        return edge
-    
-    @trig_edge.setter
-    def trig_edge(self, edge):
-        self.set(f":PULSE0:TRIG:EDGE", edge)
-        self.check_ok()
-
-    @property
-    def gate_mode(self):
-        gate_mode = self.query(":PULSE0:GATE:MODE").strip()
-        self.check_ok()
-        return gate_mode
-
-    @gate_mode.setter
-    def gate_mode(self, mode):
-        self.set(f":PULSE0:GATE:MODE", mode)
-        self.check_ok()
-
-    @property        
-    def gate_thresh(self):
-        thresh = float(self.query(":PULSE0:GATE:LEV").strip())
-        self.check_ok()
-        return thresh
-    
-    @gate_thresh.setter
-    def gate_thresh(self, thresh):
-        self.set(f":PULSE0:GATE:LEV", str(thresh))
-        self.check_ok()
+        self._channel = CHANNELS.get(channel_label, 1)
+        self.cache.invalidate(f":PULSE{self._channel}:")
 
     @property
     def gate_logic(self):
-        global_gate_mode = self.query(":PULSE0:GATE:MODE").strip()
-        self.check_ok()
-        if global_gate_mode == "CHAN":
-            channel = self.set_channel()
-            logic = self.query(f":PULSE{channel}:CLOGIC").strip()
-            self.check_ok()
-            return logic
-        else:
-            logic = self.query(f":PULSE0:GATE:LOGIC").strip()
-            self.check_ok()
-            return logic
+        if self.gate_mode == "CHAN":
+            return self.channel_logic
+        return self.global_logic
         
     @gate_logic.setter
     def gate_logic(self, logic):
-        global_gate_mode = self.query(":PULSE0:GATE:MODE").strip()
-        self.check_ok()
-        if global_gate_mode == "CHAN":
-            channel = self.set_channel()
-            self.set(f":PULSE{channel}:CLOGIC", logic)
-            self.check_ok()
-        else:
-            self.set(f":PULSE0:GATE:LOGIC", logic)
-            self.check_ok()
+        self.transaction({'gate_logic': logic})
 
     @property
     def channel_gate_mode(self):
-        global_gate_mode = self.query(":PULSE0:GATE:MODE").strip()
-        self.check_ok()
-        if global_gate_mode == "CHAN":
-            channel = self.set_channel()
-            mode = self.query(f":PULSE{channel}:CGATE").strip()
-            self.check_ok()
-            return mode
-        else:
-            return "DIS"
+        if self.gate_mode == "CHAN":
+            return self.channel_gate
+        return "DIS"
         
     @channel_gate_mode.setter
     def channel_gate_mode(self, channel_gate_mode):
-        global_gate_mode = self.query(":PULSE0:GATE:MODE").strip()
-        self.check_ok()
-        channel = self.set_channel()
-        if global_gate_mode == "CHAN":
-            self.set(f":PULSE{channel}:CGATE", channel_gate_mode)
-            self.check_ok()
-        else:
-            self.set(f":PULSE0:GATE:MODE", "CHAN")
-            self.check_ok()
-            self.set(f":PULSE{channel}:CGATE", channel_gate_mode)
-            self.check_ok()
+        self.transaction({'channel_gate_mode': channel_gate_mode})
 
     @property
-    def period(self):
-        period = float(self.query(":PULSE0:PER").strip())
-        self.check_ok()
-        return period
+    def amplitude(self):
+        return REGISTERS['amplitude'].__get__(self)
     
-    @period.setter
-    def period(self, period):
-        self.set(f":PULSE0:PER", str(period))
-        self.check_ok()
+    @amplitude.setter
+    def amplitude(self, amplitude):
+        self.transaction({'amplitude': amplitude})
 
-    @property
-    def delay(self):
-        channel = self.set_channel()
-        delay = float(self.query(f":PULSE{channel}:DELAY").strip())
-        self.check_ok()
-        return delay
-
-    @delay.setter
-    def delay(self, delay):
-        channel = self.set_channel()
-        self.set(f":PULSE{channel}:DELAY", "{:10.9f}".format(delay))
-        self.check_ok()
+    def channel_value(self, channel, register, verify=False):
+        """Value of a register of a given channel, e.g. delay or width, without switching channel
 
-    @property
-    def width(self):
-        channel = self.set_channel()
-        width = float(self.query(f":PULSE{channel}:WIDT").strip())
-        self.check_ok()
-        return width
-    
-    @width.setter
-    def width(self, width):
-        channel = self.set_channel()
-        self.set(f":PULSE{channel}:WIDT", "{:10.9f}".format(width))
-        self.check_ok()
+        The acknowledged value is answered from the cache when it is trusted, unless verify is True
+        """
+        register = REGISTERS[register]
+        return register.parse(self._read(register.paths[channel], register.lines[channel], verify))
 
-    @property
-    def amplitude_mode(self):
-        channel = self.set_channel()
-        mode = self.query(f":PULSE{channel}:OUTP:MODE").strip()
-        self.check_ok()
-        return mode
-    
-    @amplitude_mode.setter
-    def amplitude_mode(self, mode):
-        channel = self.set_channel()
-        self.set(f":PULSE{channel}:OUTP:MODE", mode)
-        self.check_ok()
+    def write_many(self, values, replies=None):
+        """Set several registers in a single pipelined write
 
-    @property
-    def amplitude(self):
-        channel = self.set_channel()
-        amp = float(self.query(f":PULSE{channel}:OUTP:AMPL").strip())
-        self.check_ok()
-        return amp
-    
-    @amplitude.setter
-    def amplitude(self, amplitude):
-        amp_mode = self.amplitude_mode
-        if amp_mode == "ADJ":
-            channel = self.set_channel()
-            self.set(f":PULSE{channel}:OUTP:AMPL", str(amplitude))
-            self.check_ok()
-        else:
-            raise ValueError("In TTL mode. Switch to ADJ mode before setting amplitude.")
+        Parameters
+        ----------
+        values: dict
+            New value string of each register, keyed by SCPI path
+        replies: dict or None
+            Form the instrument returns on a query of a register, when it differs from the written value
 
-    @property
-    def polarity(self):
-        channel = self.set_channel()
-        pol = self.query(f":PULSE{channel}:POL").strip()
-        self.check_ok()
-        return pol
-    
-    @polarity.setter
-    def polarity(self, pol):
-        channel = self.set_channel()
-        self.set(f":PULSE{channel}:POL", pol)
-        self.check_ok()
+        Returns
+        -------
+        dict: True for each path the instrument acknowledged
+        """
+        paths = list(values)
+        return self._written(values, self.send_many([f"{path} {values[path]}" for path in paths]), replies)
+
+    def write_registers(self, values):
+        """Set registers of any channel in a single pipelined write
+
+        Parameters
+        ----------
+        values: dict
+            Value of each register in instrument units, keyed by (name, channel) with channel 0 for the
+            global registers, see registers.REGISTERS
+
+        Returns
+        -------
+        dict: True for each key the instrument acknowledged
+        """
+        paths, texts, replies = {}, {}, {}
+        for (name, channel), value in values.items():
+            register = REGISTERS[name]
+            path = paths[name, channel] = register.paths[channel]
+            texts[path], replies[path] = register.render(value)
+        acks = self.write_many(texts, replies)
+        return {key: acks[path] for key, path in paths.items()}
+
+    async def write_many_async(self, values):
+        """Awaitable version of write_many, see Device.send_many_async"""
+        paths = list(values)
+        return self._written(values, await self.send_many_async([f"{path} {values[path]}" for path in paths]))
+
+    def _written(self, values, answers, replies=None):
+        """Write the acknowledged values through to the cache, return the acknowledgement of each path"""
+        acks = {}
+        replies = replies or {}
+        for path, answer in zip(values, answers):
+            acks[path] = answer == "ok"
+            if acks[path]:
+                self.cache.set(path, replies.get(path, values[path]))
+            else:
+                self.cache.invalidate(path)
+        return acks
+
+    def move(self, channel, register, value):
+        """Set a timing register (delay or width, in seconds) of a channel
+
+        Moves issued concurrently from other threads, e.g. by the other axes sharing this controller,
+        are coalesced into a single pipelined write.
+
+        Returns
+        -------
+        bool: True if the instrument acknowledged the new value
+        """
+        register = REGISTERS[register]
+        return self._moves.submit(register.paths[channel], register.render(value)[0])
+
+    def move_nowait(self, channel, register, value, callback=None):
+        """Streamed version of move, returning before the instrument acknowledged the new value
+
+        Parameters
+        ----------
+        callback: callable or None
+            Called with True if the instrument acknowledged the value, False otherwise, as soon as its reply
+            arrives, in the event loop thread. Errors are also collected for the next barrier.
+
+        Returns
+        -------
+        concurrent.futures.Future: holding the list of errors once the reply arrived, see Device.stream
+        """
+        register = REGISTERS[register]
+        path = register.paths[channel]
+        text, reply = register.render(value)
+        return self._stream_writes([f"{path} {text}"], {path: reply}, callback)
+
+    def step_nowait(self, index=None, trigger=False, callback=None):
+        """Streamed version of step, returning before the instrument acknowledged the new delays
+
+        The scan table moves to the point at once, so that the next step streams the changed delays only.
+        See move_nowait for callback and the returned future.
+        """
+        table = self.scan_table
+        if index is None:
+            index = table.index + 1
+        commands, lines = table.commands(index)
+        if trigger:
+            commands, lines = commands + ["*TRG"], lines + [b"*TRG\r\n"]
+        values = dict(zip([REGISTERS['delay'].paths[channel] for channel in table.trajectory.channels],
+                          table.trajectory.values[index]))
+        table.index = index
+        return self._stream_writes(commands, values, callback, lines)
+
+    def _stream_writes(self, commands, values, callback, lines=None):
+        """Stream commands, writing values (keyed by SCPI path) through to the cache if all are acknowledged"""
+        def written(errors):
+            for path, value in values.items():
+                if errors:
+                    self.cache.invalidate(path)
+                else:
+                    self.cache.set(path, value)
+            if errors:
+                logger.warning(f"Streamed {', '.join(commands)} failed: {errors[0]}")
+            if callback is not None:
+                callback(not errors)
+
+        return self.stream(commands, written, lines)
+
+    def load_scan_table(self, delays, channel=None, constrained=True):
+        """Prepare a sequenced delay scan, see Trajectory
+
+        Parameters
+        ----------
+        delays: array_like or Trajectory
+            Delays of the scan points in seconds, in scan order, of shape (points,) for one channel or
+            (points, channels) for several, or an already built Trajectory
+        channel: int or sequence of int or None
+            Channel number (1 to 4) of each column of delays, the current channel by default. The first
+            one gives the position of the scan.
+        constrained: bool
+            If True, delays are also clamped so that the pulses end within the current period
+
+        Returns
+        -------
+        ScanTable
+
+        Raises ValueError, before anything is written, if a point breaks the timing of the current
+        configuration (see TimingModel), leaving no scan table loaded
+        """
+        if not isinstance(delays, Trajectory):
+            channels = self.set_channel() if channel is None else channel
+            constraints = {}
+            if constrained:
+                columns = (channels,) if isinstance(channels, int) else channels
+                constraints = dict(period=self.period, widths=[self.channel_value(column, 'width') for column in columns])
+            delays = Trajectory(delays, channels, **constraints)
+        model = self.timing_model().with_delays(delays.delays, delays.channels)
+        invalid = np.flatnonzero(model.invalid())
+        if len(invalid):
+            self.scan_table = None
+            raise ValueError(f"{len(invalid)} of {len(delays)} scan points break the timing, first at point "
+                             f"{invalid[0]}: {'; '.join(model.describe(invalid[0]))}")
+        self.scan_table = ScanTable(delays)
+        return self.scan_table
+
+    def timing_model(self):
+        """TimingModel of the current delays, widths, states and period of every channel
+
+        The registers missing from the cache are read in one round trip.
+        """
+        keys = [('period', 0)] + [(name, channel) for channel in CHANNELS.values()
+                                  for name in ('delay', 'width', 'channel_state')]
+        state = {key: REGISTERS[key[0]].parse(reply) for key, reply in self._current(keys).items()}
+        channels = CHANNELS.values()
+        return TimingModel([state['delay', channel] for channel in channels],
+                           [state['width', channel] for channel in channels], state['period', 0],
+                           [state['channel_state', channel] for channel in channels])
+
+    def step(self, index=None, trigger=False):
+        """Arm a point of the scan table with its pre-rendered delay writes
+
+        Parameters
+        ----------
+        index: int or None
+            Point to arm, the one following the current point by default
+        trigger: bool
+            If True, a *TRG is pipelined in the same write to fire the pulse right away
+
+        Returns
+        -------
+        bool: True if the instrument acknowledged the new delays
+        """
+        table = self.scan_table
+        if index is None:
+            index = table.index + 1
+        commands, lines = table.commands(index)
+        writes = len(commands)
+        if trigger:
+            commands, lines = commands + ["*TRG"], lines + [b"*TRG\r\n"]
+        replies = self.exchange(lines, commands)
+        paths = [REGISTERS['delay'].paths[channel] for channel in table.trajectory.channels]
+        if replies[:writes].count("ok") != writes:
+            for path in paths:
+                self.cache.invalidate(path)
+            logger.warning(f"Scan table point {index} was not accepted by the instrument: {replies[:writes]}")
+            return False
+        for path, value in zip(paths, table.trajectory.values[index]):
+            self.cache.set(path, value)
+        table.index = index
+        return True
+
+    def transaction(self, settings):
+        """Apply several settings at once, in dependency order, undoing them all if the instrument rejects one
+
+        The settings are those of the plugin (see registers.SETTINGS) plus rep_rate, the reciprocal of
+        period. The composite settings are resolved to their registers: channel_gate_mode also sets the
+        global gate mode to CHAN, gate_logic sets the channel or the global logic depending on the gate
+        mode, and amplitude requires the ADJ amplitude mode. Every value is checked against the limits of
+        its register before anything is written, and only the registers that differ from the instrument
+        are written, in one pipelined batch ordered as the register table (modes before the values they
+        enable). If a write is rejected, the registers already written are set back to their previous
+        value and the error of the instrument is raised.
+
+        Parameters
+        ----------
+        settings: dict
+            Value of each setting in instrument units (seconds, volts), keyed by name for the current
+            channel or by (name, channel)
+
+        Returns
+        -------
+        dict: value string written to each SCPI path, empty if the instrument already had every value
+
+        Raises ValueError for an invalid setting, before writing anything, and the DeviceError of the first
+        rejected write, or ConnectionError if a write got no reply, after the rollback
+        """
+        targets = {}
+        for key, value in settings.items():
+            name, channel = (key, self.set_channel()) if isinstance(key, str) else key
+            if name == 'rep_rate':
+                if value <= 0:
+                    raise ValueError(f"Invalid rep_rate {value!r}")
+                name, value = 'period', 1.0 / value
+            if name not in SETTINGS or name == 'id':
+                raise ValueError(f"Unknown setting {name}")
+            channel = channel if any(REGISTERS[register].scope == 'channel' for register in SETTINGS[name][0]) else 0
+            if targets.get((name, channel), value) != value:
+                raise ValueError(f"Conflicting values of {name}: {targets[name, channel]!r} and {value!r}")
+            targets[name, channel] = value
+
+        # current value of the registers written or depended upon, for the diff, the checks and the rollback
+        keys = {(register, 0 if REGISTERS[register].scope == 'global' else channel): None
+                for name, channel in targets for register in SETTINGS[name][0]}
+        keys.update({('amplitude_mode', channel): None for name, channel in targets if name == 'amplitude'})
+        current = self._current(list(keys))
+
+        def target(register, channel):
+            key = (register, 0 if REGISTERS[register].scope == 'global' else channel)
+            if key in registers:
+                return registers[key]
+            return REGISTERS[register].parse(current[key])
+
+        registers = {}
+        for (name, channel), value in targets.items():
+            if name not in ('channel_gate_mode', 'gate_logic'):
+                registers[name, channel] = value
+        for (name, channel), value in targets.items():
+            if name == 'channel_gate_mode':
+                if registers.get(('gate_mode', 0), "CHAN") != "CHAN":
+                    raise ValueError(f"channel_gate_mode requires the CHAN gate mode, not {registers['gate_mode', 0]}")
+                registers['gate_mode', 0] = "CHAN"
+                registers['channel_gate', channel] = value
+        for (name, channel), value in targets.items():
+            if name == 'gate_logic':
+                if target('gate_mode', channel) == "CHAN":
+                    registers['channel_logic', channel] = value
+                else:
+                    registers['global_logic', 0] = value
+        for (name, channel), value in registers.items():
+            REGISTERS[name].validate(value)
+            if name == 'amplitude' and target('amplitude_mode', channel) != "ADJ":
+                raise ValueError("In TTL mode. Switch to ADJ mode before setting amplitude.")
+
+        order = {name: index for index, name in enumerate(REGISTERS)}
+        values, replies, previous = {}, {}, {}
+        for name, channel in sorted(registers, key=lambda key: (order[key[0]], key[1])):
+            register = REGISTERS[name]
+            path = register.paths[channel]
+            text, reply = register.render(registers[name, channel])
+            if (name, channel) in current and self._same_value(current[name, channel], reply):
+                continue
+            values[path], replies[path] = text, reply
+            previous[path] = register.render(register.parse(current[name, channel]))
+        if not values:
+            return {}
+
+        answers = self.send_many([f"{path} {text}" for path, text in values.items()])
+        self._written(values, answers, replies)
+        failed = next(((path, answer) for path, answer in zip(values, answers) if answer != "ok"), None)
+        if failed is None:
+            return values
+        written = [path for path, answer in zip(values, answers) if answer == "ok"]
+        if written:
+            undo = {path: previous[path][0] for path in reversed(written)}
+            self.write_many(undo, {path: previous[path][1] for path in undo})
+            logger.warning(f"Rolled back {', '.join(written)} after the device rejected {failed[0]}")
+        path, answer = failed
+        error = error_for(answer.encode(), f"{path} {values[path]}")
+        if error is None:
+            raise ConnectionError(f"No reply from the device to {path} {values[path]}")
+        raise error
+
+    def _current(self, keys):
+        """Reply of the registers of each (name, channel), from the cache when it is trusted, the other ones
+        read in one round trip"""
+        current = {}
+        if self.trust_cache:
+            current = {key: self.cache.get(REGISTERS[key[0]].paths[key[1]]) for key in keys}
+        missing = [key for key in keys if current.get(key) is None]
+        if missing:
+            replies = self.read_registers(missing)
+            failed = [f"{name} ({channel})" for (name, channel), reply in replies.items()
+                      if not reply or reply.startswith("?")]
+            if failed:
+                raise ConnectionError(f"Could not read {', '.join(failed)}")
+            current.update(replies)
+        return current
+
+    def capture_profile(self):
+        """Current configuration of the instrument, as a profile (see profiles.py) read in one round trip"""
+        keys = [(name, 0) for name in PROFILE_SYSTEM] + \
+            [(name, channel) for channel in CHANNELS.values() for name in PROFILE_CHANNEL]
+        replies = self.read_registers(keys)
+        missing = [f"{name} ({channel})" for (name, channel), reply in replies.items() if not reply or reply.startswith("?")]
+        if missing:
+            raise ConnectionError(f"Could not read {', '.join(missing)}")
+        profile = {'system': {name: REGISTERS[name].parse(replies[name, 0]) for name in PROFILE_SYSTEM}}
+        profile['channels'] = {label: {name: REGISTERS[name].parse(replies[name, channel]) for name in PROFILE_CHANNEL}
+                               for label, channel in CHANNELS.items()}
+        return profile
+
+    def apply_profile(self, profile):
+        """Set the instrument to a profile, writing in one batch only the registers that differ from the cache
+
+        Registers missing from the cache are written too. Registers missing from the profile are left as
+        they are.
+
+        Returns
+        -------
+        dict: True for each written SCPI path the instrument acknowledged, empty if nothing had to change
+        """
+        targets = [(REGISTERS[name], 0, value) for name, value in profile.get('system', {}).items()]
+        for label, registers in profile.get('channels', {}).items():
+            targets += [(REGISTERS[name], CHANNELS[label], value) for name, value in registers.items()]
+        values, replies = {}, {}
+        for register, channel, value in targets:
+            path = register.paths[channel]
+            text, reply = register.render(value)
+            cached = self.cache.get(path)
+            if cached is None or not self._same_value(cached, reply):
+                values[path], replies[path] = text, reply
+        if not values:
+            return {}
+        return self.write_many(values, replies)
+
+    def read_registers(self, names, channel=None, background=False):
+        """Query several registers in a single pipelined round trip, bypassing the cache
+
+        Parameters
+        ----------
+        names: iterable of str or of (str, int)
+            Names of the registers (see registers.REGISTERS), or (name, channel) pairs to read the
+            registers of several channels at once
+        channel: int or None
+            Channel of the channel registers given by name, the current one by default
+        background: bool
+            True when called by a background task, see Device.send_many
+
+        Returns
+        -------
+        dict: reply of each register, '' for a register that did not reply in time, keyed as in names
+        """
+        channel = self.set_channel() if channel is None else channel
+        keys = list(names)
+        targets = [(REGISTERS[key], channel) if isinstance(key, str) else (REGISTERS[key[0]], key[1]) for key in keys]
+        replies = self.exchange([register.lines[index] for register, index in targets],
+                                [register.queries[index] for register, index in targets], background)
+        for (register, index), reply in zip(targets, replies):
+            if reply and not reply.startswith("?"):
+                self.cache.set(register.paths[index], reply)
+        return dict(zip(keys, replies))
+
+    @staticmethod
+    def _state_value(name, replies):
+        """Value of a setting (see registers.SETTINGS) from the replies of its registers"""
+        if name == 'channel_gate_mode':
+            return replies['channel_gate'] if replies['gate_mode'] == "CHAN" else "DIS"
+        if name == 'gate_logic':
+            return replies['channel_logic'] if replies['gate_mode'] == "CHAN" else replies['global_logic']
+        return REGISTERS[name].parse(replies[name])
+
+    def read_state(self, names=None, background=False):
+        """Read the instrument state in a single pipelined round trip
+
+        Parameters
+        ----------
+        names: iterable of str or None
+            Settings to read, all of them by default (see registers.SETTINGS). Registers shared by several
+            settings are queried once.
+        background: bool
+            True when called by a background task, see Device.send_many
+
+        Returns
+        -------
+        dict: current value of each requested setting shown in the plugin
+
+        Raises ConnectionError if a register did not reply in time
+        """
+        names = list(SETTINGS) if names is None else [name for name in names if name in SETTINGS]
+        registers = dict.fromkeys(register for name in names for register in SETTINGS[name][0])
+        replies = self.read_registers(registers, background=background)
+        missing = [name for name, reply in replies.items() if not reply]
+        if missing:
+            raise ConnectionError(f"No reply from the device to {', '.join(missing)}")
+        return {name: self._state_value(name, replies) for name in names}
+
+    def output(self, state=None):
+        """Parameter definitions of the plugin settings
+
+        Parameters
+        ----------
+        state: dict or None
+            Value of every setting, e.g. registers.initial_state() to build the settings without waiting for
+            the instrument. The current state of the instrument is read by default.
+        """
+        state = self.read_state() if state is None else state
+
+        def param(name):
+            return REGISTERS[SETTINGS[name][1]].parameter(state[name], name)
 
-    def output(self):
         return [
             {
                 'title': 'Connection', 'name': 'connection', 'type': 'group', 'children': [
-                    {'title': 'Controller', 'name': 'id', 'type': 'str', 'value': self.idn(), 'readonly': True},
+                    param('id'),
                     {'title': 'IP', 'name': 'ip', 'type': 'str', 'value': self.ip, 'default': self.ip},
                     {'title': 'Port', 'name': 'port', 'type': 'int', 'value': self.port, 'default': 2001},
-                    {'title': 'Still Communicating ?', 'name': 'still_communicating', 'type': 'led', 'value': False}
+                    {'title': 'Still Communicating ?', 'name': 'still_communicating', 'type': 'led', 'value': False},
+                    {'title': 'Writes Pending ?', 'name': 'writes_pending', 'type': 'led', 'value': False,
+                     'tip': 'Setting changes are waiting to be written to the device'}
                 ]
             },
             {
                 'title': 'Device Configuration State', 'name': 'config', 'type': 'group', 'children': [
-                    {'title': 'Configuration Label', 'name': 'label', 'type': 'str', 'value': self.label},
+                    param('label'),
                     {'title': 'Local Memory Slot', 'name': 'slot', 'type': 'list', 'value': self.slot, 'limits': list(range(1, 13))},
                     {'title': 'Save Current Configuration?', 'name': 'save', 'type': 'bool_push', 'label': 'Save', 'value': False},
                     {'title': 'Restore Previous Configuration?', 'name': 'restore', 'type': 'bool_push', 'label': 'Restore', 'value': False},
-                    {'title': 'Reset Device?', 'name': 'reset', 'type': 'bool_push', 'label': 'Reset', 'value': False}
+                    {'title': 'Reset Device?', 'name': 'reset', 'type': 'bool_push', 'label': 'Reset', 'value': False},
+                    {'title': 'Trust Cached State?', 'name': 'trust_cache', 'type': 'bool', 'value': self.trust_cache},
+                    {'title': 'Cache Lifetime (s)', 'name': 'cache_ttl', 'type': 'float', 'value': self.cache.ttl or 0.0, 'default': 0.0, 'min': 0.0,
+                     'tip': 'Cached register values older than this are read again from the instrument (0: never expire)'}
                 ]
             },
             {
                 'title': 'Device Output State', 'name': 'output', 'type': 'group', 'children': [
-                    {'title': 'Global State', 'name': 'global_state', 'type': 'led_push', 'value': self.global_state},
-                    {'title': 'Global Mode', 'name': 'global_mode', 'type': 'list', 'value': self.global_mode, 'limits': ['NORM', 'SING', 'BURS', 'DCYC']},
-                    {'title': 'Channel', 'name': 'channel_label', 'type': 'list', 'value': self.channel_label, 'limits': ['A', 'B', 'C', 'D']},
-                    {'title': 'Channel Mode', 'name': 'channel_mode', 'type': 'list', 'value': self.channel_mode, 'limits': ['NORM', 'SING', 'BURS', 'DCYC']},
-                    {'title': 'Channel State', 'name': 'channel_state', 'type': 'led_push', 'value': self.channel_state},
-                    {'title': 'Width (ns)', 'name': 'width', 'type': 'float', 'value': self.width * 1e9, 'default': 10, 'min': 10, 'max': 999e9},
-                    {'title': 'Delay (ns)', 'name': 'delay', 'type': 'float', 'value': self.delay * 1e9, 'default': 0, 'min': 0, 'max': 999e9}
+                    param('global_state'),
+                    param('global_mode'),
+                    {'title': 'Channel', 'name': 'channel_label', 'type': 'list', 'value': self.channel_label, 'limits': list(CHANNELS)},
+                    param('channel_mode'),
+                    param('channel_state'),
+                    param('width'),
+                    param('delay')
                 ]
             },
             {
                 'title': 'Amplitude Profile', 'name': 'amp', 'type': 'group', 'children': [
-                    {'title': 'Amplitude Mode', 'name': 'amplitude_mode', 'type': 'list', 'value': self.amplitude_mode, 'limits': ['ADJ', 'TTL']},
-                    {'title': 'Amplitude (V)', 'name': 'amplitude', 'type': 'float', 'value': self.amplitude, 'default': 2.0, 'min': 2.0, 'max': 20.0},
-                    {'title': 'Polarity', 'name': 'polarity', 'type': 'list', 'value': self.polarity, 'limits': ['NORM', 'COMP', 'INV']}
+                    param('amplitude_mode'),
+                    param('amplitude'),
+                    param('polarity')
                 ]
             },
             {
                 'title': 'Continuous Mode', 'name': 'continuous_mode', 'type': 'group', 'children': [
-                    {'title': 'Period (s)', 'name': 'period', 'type': 'float', 'value': self.period, 'default': 1e-3, 'min': 100e-9, 'max': 5000.0},
-                    {'title': 'Repetition Rate (Hz)', 'name': 'rep_rate', 'type': 'float', 'value': 1.0 / self.period, 'default': 1e3, 'min': 2e-4, 'max': 10e6}
+                    param('period'),
+                    {'title': 'Repetition Rate (Hz)', 'name': 'rep_rate', 'type': 'float', 'value': 1.0 / state['period'], 'default': 1e3, 'min': 2e-4, 'max': 10e6}
                 ]
             },
             {
                 'title': 'Trigger Mode', 'name': 'trigger_mode', 'type': 'group', 'children': [
-                    {'title': 'Trigger Mode', 'name': 'trig_mode', 'type': 'list', 'value': self.trig_mode, 'limits': ['DIS', 'TRIG']},
-                    {'title': 'Trigger Threshold (V)', 'name': 'trig_thresh', 'type': 'float', 'value': self.trig_thresh, 'default': 2.5, 'min': 0.2, 'max': 15.0},
-                    {'title': 'Trigger Edge', 'name': 'trig_edge', 'type': 'list', 'value': self.trig_edge, 'limits': ['RIS', 'FALL']}
+                    param('trig_mode'),
+                    param('trig_thresh'),
+                    param('trig_edge')
                 ]
             },
             {
                 'title': 'Gating', 'name': 'gating', 'type': 'group', 'children': [
-                    {'title': 'Global Gate Mode', 'name': 'gate_mode', 'type': 'list', 'value': self.gate_mode, 'limits': ['DIS', 'PULS', 'OUTP', 'CHAN']},
-                    {'title': 'Channel Gate Mode', 'name': 'channel_gate_mode', 'type': 'list', 'value': self.channel_gate_mode, 'limits': ['DIS', 'PULS', 'OUTP']},
-                    {'title': 'Gate Threshold (V)', 'name': 'gate_thresh', 'type': 'float', 'value': self.gate_thresh, 'default': 2.5, 'min': 0.2, 'max': 15.0},
-                    {'title': 'Gate Logic', 'name': 'gate_logic', 'type': 'list', 'value': self.gate_logic, 'limits': ['HIGH', 'LOW']}
+                    param('gate_mode'),
+                    param('channel_gate_mode'),
+                    param('gate_thresh'),
+                    param('gate_logic')
                 ]
             }
         ]
 
+
+# Every register of the table is a property of the controller, except those given a property above
+for _register in REGISTERS.values():
+    if _register.name not in vars(BNC575):
+        setattr(BNC575, _register.name, _register)
@@ -0,0 +1,47 @@
+import time
+
+
+class RegisterCache:
+    """Last known value of the instrument registers, keyed by SCPI path
+
+    Values are stored in the form the instrument returns them on a query, so a cached read is
+    indistinguishable from a read on the wire.
+
+    Parameters
+    ----------
+    ttl: float or None
+        Lifetime of an entry in seconds. None means entries never expire on their own and are only
+        dropped by an explicit invalidation.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._values = {}
+
+    def get(self, path):
+        """Return the cached value of a register, or None if unknown or expired"""
+        entry = self._values.get(path)
+        if entry is None:
+            return None
+        value, stamp = entry
+        if self.ttl is not None and time.monotonic() - stamp > self.ttl:
+            del self._values[path]
+            return None
+        return value
+
+    def set(self, path, value):
+        self._values[path] = (value, time.monotonic())
+
+    def invalidate(self, prefix=""):
+        """Drop every entry whose SCPI path starts with prefix (all entries by default)"""
+        if not prefix:
+            self._values.clear()
+            return
+        for path in [path for path in self._values if path.startswith(prefix)]:
+            del self._values[path]
+
+    def __contains__(self, path):
+        return self.get(path) is not None
+
+    def __len__(self):
+        return len(self._values)
@@ -0,0 +1,117 @@
+import threading
+import time
+from pymodaq_plugins_bnc.hardware import get_logger
+
+logger = get_logger(__file__)
+
+
+class DebouncedWriter:
+    """Latest-value-wins write queue collapsing bursts of changes into one write of the final values
+
+    Values submitted for the same key replace each other until no key changed for delay seconds, then
+    every queued value is written in one batch by a background thread, e.g. when a spinbox is dragged
+    through hundreds of intermediate values only the last one is written.
+
+    Hooks are called in the thread of the event with 'pending' and True or False when the queue becomes
+    busy or idle, and 'written' with the dict of written values and the dict of their acknowledgements.
+
+    Parameters
+    ----------
+    write: callable
+        Writes a dict of values and returns a dict with the acknowledgement of each of its keys
+    delay: float
+        Seconds without change before the queued values are written
+    """
+
+    def __init__(self, write, delay=0.1):
+        self.write = write
+        self.delay = delay
+        self.hooks = []
+        self._values = {}
+        self._deadline = 0.0
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._writing = False
+        self._closed = False
+        self._thread = None
+
+    @property
+    def pending(self):
+        """Keys whose latest value is not written yet"""
+        with self._cond:
+            return set(self._values)
+
+    def submit(self, key, value):
+        """Queue value for key, replacing the one not written yet, if any"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Writer is closed")
+            idle = not self._values and not self._writing
+            self._values[key] = value
+            self._deadline = time.monotonic() + self.delay
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="BNC575 debounced writer", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        if idle:
+            self._notify('pending', True)
+
+    def discard(self, keys=None):
+        """Forget the queued values of keys, of every key by default"""
+        with self._cond:
+            for key in list(self._values) if keys is None else keys:
+                self._values.pop(key, None)
+
+    def flush(self):
+        """Write the queued values now, in the calling thread, once the write in flight is done"""
+        with self._write_lock:
+            with self._cond:
+                values, self._values = self._values, {}
+            if values:
+                self._write(values)
+
+    def close(self, flush=True):
+        """Stop the writer thread, writing the queued values first unless flush is False"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+        if flush:
+            self.flush()
+        else:
+            self.discard()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._values and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                remaining = self._deadline - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+            self.flush()
+
+    def _write(self, values):
+        acks = {}
+        with self._cond:
+            self._writing = True
+        try:
+            acks = self.write(values)
+        except Exception as e:
+            logger.warning(f"Write of {', '.join(map(str, values))} failed: {e}")
+        finally:
+            with self._cond:
+                self._writing = False
+                idle = not self._values
+        self._notify('written', values, acks)
+        if idle:
+            self._notify('pending', False)
+
+    def _notify(self, event, *args):
+        for hook in self.hooks:
+            hook(event, *args)
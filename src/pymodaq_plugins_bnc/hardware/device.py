@@ -1,37 +1,366 @@
-import telnetlib
-from qtpy.QtCore import QObject, Signal
+import asyncio
+import contextlib
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError, wait
+from pymodaq_plugins_bnc.hardware import get_logger
+from pymodaq_plugins_bnc.hardware.framing import DeviceError
+from pymodaq_plugins_bnc.hardware.metrics import Metrics
+from pymodaq_plugins_bnc.hardware.transport import pool
+
+logger = get_logger(__file__)
+
 
 class Device:
-    def __init__(self, ip, port):
-        self.com = telnetlib.Telnet(ip, port, 100)
+    def __init__(self, ip, port, timeout=3.0, background_connect=False, replay=None, replay_speed=1.0):
         self._ip = ip
         self._port = port
-        self.listener = self.DeviceListener()
+        self.timeout = timeout
+        self.hooks = []
+        self._listener = None
         self.still_communicating = False
+        self.metrics = None
+        self._recorder = None
+        self.last_foreground = 0.0
+        self._foreground = 0
+        self._foreground_lock = threading.Lock()
+        self.stream_errors = []
+        self._streamed = set()
+        self._stream_lock = threading.Lock()
+        if replay is None:
+            self._transport = pool.acquire(ip, port)
+        else:  # answered from a recording of this address instead of the instrument, see recording
+            from pymodaq_plugins_bnc.hardware.recording import ReplayTransport
+            self._transport = ReplayTransport(replay, ip, port, speed=replay_speed)
+        self._transport.listeners.append(self._count)
+        self._connected = asyncio.run_coroutine_threadsafe(self._transport.open(), self._transport.loop)
+        if not background_connect:
+            self.wait_connected()
+
+    def wait_connected(self, timeout=None):
+        """Wait for the connection opened by the constructor, raising ConnectionError if it failed
+
+        With background_connect, the constructor returns at once and the first exchange waits for the
+        connection, so only callers wanting to report a failure early need this.
+        """
+        return self._connected.result(timeout)
+
+    @property
+    def listener(self):
+        """Qt signals of the device (see signals.DeviceListener), an adapter on the hooks created on first use"""
+        if self._listener is None:
+            from pymodaq_plugins_bnc.hardware.signals import DeviceListener
+            self._listener = DeviceListener()
+            self.hooks.append(self._listener.forward)
+        return self._listener
+
+    def _notify(self, event, *args):
+        """Call the hooks with an event: 'ok_received', or 'still_communicating' with True or False
+
+        Hooks are plain callables appended to hooks, called in the thread of the exchange.
+        """
+        for hook in self.hooks:
+            hook(event, *args)
+
+    def enable_metrics(self, trace_size=0):
+        """Start collecting timing metrics of every exchange, see Metrics
+
+        Parameters
+        ----------
+        trace_size: int
+            Number of most recent exchanges kept in metrics.trace, 0 for no trace
+
+        Returns
+        -------
+        Metrics
+        """
+        self.metrics = Metrics(trace_size)
+        return self.metrics
+
+    def disable_metrics(self):
+        self.metrics = None
+
+    def record(self, recorder):
+        """Log every exchange of the connection, with its timing, to a file that a replay can answer from
+
+        Parameters
+        ----------
+        recorder: str or Path or recording.Recorder
+            JSON lines file to append to, or a recorder shared with other devices
+
+        Returns
+        -------
+        recording.Recorder
+        """
+        from pymodaq_plugins_bnc.hardware.recording import Recorder
+        if not isinstance(recorder, Recorder):
+            recorder = Recorder(recorder)
+        self.stop_recording()
+        recorder.attach(self)
+        self._recorder = recorder
+        return recorder
+
+    def stop_recording(self):
+        """Stop logging the exchanges, the recording is closed once no device records to it
+
+        Returns
+        -------
+        recording.Recorder or None
+        """
+        recorder, self._recorder = self._recorder, None
+        if recorder is not None:
+            recorder.detach(self)
+        return recorder
+
+    def _count(self, event):
+        if self.metrics is not None:
+            self.metrics.count(event)
+
+    def _run(self, coro):
+        """Run a coroutine on the transport event loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self._transport.loop).result()
+
+    @staticmethod
+    def _encode(msgs):
+        return [(msg + "\r\n").encode() for msg in msgs]
+
+    def _submit(self, lines, msgs):
+        """Write encoded command lines back to back and return the futures that will hold their replies
+
+        Raises ConnectionError if the device stays unreachable after the transport's bounded retries
+        """
+        futures = self._run(self._transport.submit(lines))
+        logger.debug("SENDING: %s", msgs)
+        return futures
+
+    def submit_many(self, msgs):
+        """Write commands without waiting for their replies
+
+        Returns
+        -------
+        list of concurrent.futures.Future: one future per command, holding its reply line
+        """
+        return self._submit(self._encode(msgs), msgs)
+
+    def stream(self, msgs, callback=None, lines=None):
+        """Write commands without waiting for their replies, collecting the errors for the next barrier
+
+        The replies are consumed by the event loop as they arrive. The device counts as busy until then,
+        so background tasks do not queue ahead of streamed writes.
+
+        Parameters
+        ----------
+        msgs: list of str
+            SCPI commands, without line termination
+        callback: callable or None
+            Called with the list of errors of the commands (DeviceError or ConnectionError, empty if every
+            command succeeded) as soon as the last reply arrives, in the event loop thread
+        lines: list of bytes or None
+            The same commands already encoded, e.g. the lines of a scan table
+
+        Returns
+        -------
+        concurrent.futures.Future: holding the list of errors once every reply arrived
+        """
+        lines = self._encode(msgs) if lines is None else lines
+        with self._foreground_lock:
+            self._foreground += 1
+        try:
+            futures = self._submit(lines, msgs)
+        except Exception:
+            self._stream_done()
+            raise
+        done = Future()
+        with self._stream_lock:
+            self._streamed.add(done)
+        remaining = [len(futures)]
+
+        def collect(_):
+            with self._stream_lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+                errors = [future.exception() for future in futures if future.exception() is not None]
+                self.stream_errors.extend(errors)
+                self._streamed.discard(done)
+            self._stream_done()
+            for error in errors:
+                self._count('error_replies' if isinstance(error, DeviceError) else 'connection_errors')
+            if callback is not None:
+                callback(errors)
+            done.set_result(errors)
+
+        for future in futures:
+            future.add_done_callback(collect)
+        return done
+
+    def _stream_done(self):
+        with self._foreground_lock:
+            self._foreground -= 1
+            self.last_foreground = time.monotonic()
+
+    def barrier(self, timeout=None):
+        """Wait until every streamed command got its reply, then raise the first error collected since the
+        previous barrier, if any
+
+        Parameters
+        ----------
+        timeout: float or None
+            Seconds to wait, the timeout of the device by default. TimeoutError is raised when exceeded.
+        """
+        with self._stream_lock:
+            streamed = list(self._streamed)
+        _, pending = wait(streamed, self.timeout if timeout is None else timeout)
+        if pending:
+            raise TimeoutError(f"{len(pending)} streamed writes still waiting for the device")
+        with self._stream_lock:
+            errors, self.stream_errors = self.stream_errors, []
+        if errors:
+            if len(errors) > 1:
+                logger.warning(f"{len(errors)} streamed commands failed: {', '.join(map(str, errors))}")
+            raise errors[0]
+
+    async def send_many_async(self, msgs, strict=False):
+        """Awaitable version of send_many, usable from any asyncio event loop
+
+        Commands to several devices can be gathered so that their round trips overlap.
+        """
+        with self._foreground_exchange():
+            futures = await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(self._transport.submit(self._encode(msgs)), self._transport.loop))
+            replies = await asyncio.wait_for(asyncio.gather(*[asyncio.wrap_future(future) for future in futures],
+                                                            return_exceptions=True), self.timeout)
+        for reply in replies:
+            if isinstance(reply, DeviceError) and strict or isinstance(reply, ConnectionError):
+                raise reply
+        return [reply.reply if isinstance(reply, DeviceError) else reply.decode(errors="replace")
+                for reply in replies]
+
+    def reconnect(self):
+        """Drop the connection and open it again"""
+        self._run(self._transport.close())
+        self._run(self._transport.open())
+
+    def close(self):
+        """Release the connection, which the pool keeps open for a while for the next controller"""
+        self.stop_recording()
+        if self._count in self._transport.listeners:
+            self._transport.listeners.remove(self._count)
+        pool.release(self._transport)
+
+    def _wait(self, future, msg, timeout, strict=False):
+        try:
+            message = future.result(timeout=timeout).decode(errors="replace")
+        except DeviceError as e:
+            self._count('error_replies')
+            if strict:
+                raise
+            logger.warning(str(e))
+            return e.reply
+        except FutureTimeoutError:
+            future.cancel()
+            self._count('timeouts')
+            logger.warning(f"Timeout waiting for device response to {msg}")
+            return ''
+        except ConnectionError as e:
+            self._count('connection_errors')
+            logger.warning(f"Connection lost while waiting for response to {msg}: {e}")
+            return ''
+        self._notify('ok_received')
+        logger.debug("RECEIVED: %s", message)
+        return message
 
     def send(self, msg):
-        sent = False
-        msg += "\r\n"
-        self.listener.still_communicating.emit(True)
+        return self.send_many([msg])[0]
+
+    @property
+    def busy(self):
+        """True while a foreground exchange is in flight"""
+        return self._foreground > 0
+
+    def send_many(self, msgs, background=False, strict=False):
+        """Pipeline several commands in a single write and collect their replies in order
+
+        Parameters
+        ----------
+        msgs: list of str
+            SCPI commands, without line termination
+        background: bool
+            True for exchanges of a background task (see StatePoller), which neither mark the device busy
+            nor toggle the still_communicating signal
+        strict: bool
+            True to raise the DeviceError of the first error reply, e.g. InvalidParameter, instead of
+            returning the error code as reply
+
+        Returns
+        -------
+        list of str: one reply per command, '' for a command whose reply did not arrive in time
+        """
+        if not msgs:
+            return []
+        return self.exchange(self._encode(msgs), msgs, background, strict)
+
+    def exchange(self, lines, msgs, background=False, strict=False):
+        """send_many of commands already encoded, e.g. the precompiled queries of the register table
+
+        Parameters
+        ----------
+        lines: list of bytes
+            Encoded commands, with line termination
+        msgs: list of str
+            The same commands as text, for logging and metrics
+        background, strict: bool
+            See send_many
+        """
+        if background:
+            return self._exchange(lines, msgs, strict)
+        with self._foreground_exchange():
+            return self._exchange(lines, msgs, strict)
+
+    @contextlib.contextmanager
+    def _foreground_exchange(self):
+        """Mark the device busy and signal still_communicating for the duration of an exchange"""
+        with self._foreground_lock:
+            self._foreground += 1
+        self._notify('still_communicating', True)
         try:
-            while not sent:
-                try:
-                    self.com.write(msg.encode())
-                    print("SENDING:", msg)
-                    sent = True
-                    message = self.com.read_until(b"\n", timeout=1).decode().strip()
-                    self.listener.ok_received.emit()
-                    print("RECEIVED:", message)
-                except OSError:
-                    self.com.open(self._ip, self._port, 100)
-            return message
+            yield
         finally:
-            self.listener.still_communicating.emit(False)
+            with self._foreground_lock:
+                self._foreground -= 1
+                self.last_foreground = time.monotonic()
+            self._notify('still_communicating', False)
+
+    def _exchange(self, lines, msgs, strict):
+        if self.metrics is not None:
+            return self._exchange_timed(lines, msgs, strict)
+        futures = self._submit(lines, msgs)
+        deadline = time.perf_counter() + self.timeout
+        return [self._wait(future, msg, max(deadline - time.perf_counter(), 0), strict)
+                for future, msg in zip(futures, msgs)]
+
+    def _exchange_timed(self, lines, msgs, strict):
+        """exchange recording each command in self.metrics"""
+        metrics = self.metrics
+        sent = time.perf_counter()
+        futures = self._submit(lines, msgs)
+        written = time.perf_counter()
+        deadline = written + self.timeout
+        replies = []
+        for future, msg in zip(futures, msgs):
+            reply = self._wait(future, msg, max(deadline - time.perf_counter(), 0), strict)
+            done = time.perf_counter()
+            replies.append(reply)
+            metrics.record(msg, reply, sent, written, getattr(future, 'received', done), done)
+        return replies
 
     def query(self,msg):
         msg = msg+"?"
         return self.send(msg)
 
+    def query_many(self, msgs, background=False):
+        return self.send_many([msg+"?" for msg in msgs], background)
+
     def set(self, msg, val):
         msg = msg+" "+val
         return self.send(msg)
@@ -41,7 +370,3 @@ class Device:
         for i in commands:
             msg += ":"+i
         return msg
-    
-    class DeviceListener(QObject):
-        ok_received = Signal()
-        still_communicating = Signal(bool)
\ No newline at end of file
@@ -0,0 +1,118 @@
+"""
+Framing of the reply stream of the instrument into lines, and parsing of the replies from bytes
+
+The instrument terminates every reply with CR LF. A pipelined batch brings back dozens of replies,
+which usually arrive together in a few reads, so the reader appends each read to one receive buffer
+and splits all the complete lines out of it at once, keeping a partial last line for the next read.
+"""
+
+
+class DeviceError(Exception):
+    """Error reply of the instrument to a command
+
+    Attributes
+    ----------
+    reply: str
+        The error code as replied by the instrument, e.g. '?5'
+    command: str or None
+        The command it replied to, when known
+    """
+
+    code = None
+    description = "Unknown error"
+
+    def __init__(self, reply, command=None):
+        self.reply = reply
+        self.command = command
+        target = f" to {command}" if command else ""
+        super().__init__(f"{self.description} ({reply}){target}")
+
+
+class IncorrectPrefix(DeviceError):
+    code = 1
+    description = "Incorrect prefix, i.e. no colon or * to start the command"
+
+
+class MissingKeyword(DeviceError):
+    code = 2
+    description = "Missing command keyword"
+
+
+class InvalidKeyword(DeviceError):
+    code = 3
+    description = "Invalid command keyword"
+
+
+class MissingParameter(DeviceError):
+    code = 4
+    description = "Missing parameter"
+
+
+class InvalidParameter(DeviceError):
+    code = 5
+    description = "Invalid parameter"
+
+
+class QueryOnly(DeviceError):
+    code = 6
+    description = "Query only, command needs a question mark"
+
+
+class InvalidQuery(DeviceError):
+    code = 7
+    description = "Invalid query, command does not have a query form"
+
+
+ERRORS = {f"?{error.code}".encode(): error for error in (IncorrectPrefix, MissingKeyword, InvalidKeyword,
+                                                         MissingParameter, InvalidParameter, QueryOnly,
+                                                         InvalidQuery)}
+
+OK = b"ok"
+
+
+def error_for(line, command=None):
+    """DeviceError matching an error reply line, None if the line is not an error reply"""
+    if not line.startswith(b"?"):
+        return None
+    return ERRORS.get(line, DeviceError)(line.decode(errors="replace"), command)
+
+
+def parse_number(line):
+    """Float value of a numeric reply line, raising the matching DeviceError for an error reply"""
+    error = error_for(line)
+    if error is not None:
+        raise error
+    return float(line)
+
+
+class ReplyFramer:
+    """Reusable receive buffer splitting the reply stream into stripped lines
+
+    Parameters
+    ----------
+    max_line: int
+        Length beyond which an unterminated line is considered garbage and dropped
+    """
+
+    def __init__(self, max_line=65536):
+        self.max_line = max_line
+        self._buffer = bytearray()
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def feed(self, data):
+        """Append received bytes and return the complete lines they terminate, without CR LF"""
+        buffer = self._buffer
+        buffer += data
+        end = buffer.rfind(b"\n")
+        if end < 0:
+            if len(buffer) > self.max_line:
+                buffer.clear()
+            return []
+        lines = bytes(buffer[:end]).split(b"\n")
+        del buffer[:end + 1]
+        return [line.strip() for line in lines]
+
+    def clear(self):
+        self._buffer.clear()
@@ -0,0 +1,145 @@
+import asyncio
+from collections import defaultdict
+from pymodaq_plugins_bnc.hardware.bnc_commands import BNC575
+from pymodaq_plugins_bnc.hardware.registers import REGISTERS
+from pymodaq_plugins_bnc.hardware.transport import get_event_loop
+
+
+class BNC575Group:
+    """Several BNC575 units driven as one timing system
+
+    Writes to different units are sent at the same time on the shared event loop, so a move involving
+    every unit takes as long as the slowest unit instead of the sum of their round trips. Moves issued
+    concurrently from several threads, e.g. by the axes of all units during a scan, are coalesced per
+    unit (see BNC575.move) and the units are written in parallel.
+
+    Parameters
+    ----------
+    addresses: iterable of (str, int)
+        IP address and port of each unit, the first one being the master of the group
+    kwargs:
+        Passed to the BNC575 of every unit
+    """
+
+    def __init__(self, addresses, **kwargs):
+        self.units = []
+        self.recorder = None  # recording.Recorder of the units, see from_config
+        try:
+            for ip, port in addresses:
+                self.add(BNC575(ip, port, **kwargs))
+        except Exception:
+            self.close()
+            raise
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        """Group of the unit configured in the bnc575 section of the plugin configuration, followed by
+        the additional units listed in its units entry, recording or replaying their exchanges as configured"""
+        section = config('bnc575')
+        units = [(section['ip'], section['port'])]
+        units += [(unit['ip'], unit.get('port', 2001)) for unit in section.get('units', [])]
+        if section.get('replay'):
+            kwargs.update(replay=section['replay'], replay_speed=section.get('replay_speed', 1.0))
+        group = cls(units, **kwargs)
+        if section.get('record'):
+            from pymodaq_plugins_bnc.hardware.recording import Recorder
+            group.recorder = Recorder(section['record'])
+            for unit in group.units:
+                unit.record(group.recorder)
+        return group
+
+    def add(self, unit):
+        """Add an already connected unit to the group"""
+        unit.group = self
+        self.units.append(unit)
+        return unit
+
+    def __len__(self):
+        return len(self.units)
+
+    def __getitem__(self, index):
+        return self.units[index]
+
+    def __iter__(self):
+        return iter(self.units)
+
+    @property
+    def master(self):
+        return self.units[0]
+
+    def index(self, unit):
+        return self.units.index(unit)
+
+    def write_many(self, values):
+        """Set registers of several units, writing to all units in parallel
+
+        Parameters
+        ----------
+        values: dict
+            New value string of each register, keyed by (unit index, SCPI path)
+
+        Returns
+        -------
+        dict: True for each key the unit acknowledged
+        """
+        per_unit = defaultdict(dict)
+        for (index, path), value in values.items():
+            per_unit[index][path] = value
+
+        async def write_all():
+            return await asyncio.gather(*[self.units[index].write_many_async(unit_values)
+                                          for index, unit_values in per_unit.items()], return_exceptions=True)
+
+        results = asyncio.run_coroutine_threadsafe(write_all(), get_event_loop()).result()
+        acks = {}
+        for index, result in zip(per_unit, results):
+            failed = isinstance(result, BaseException)
+            for path in per_unit[index]:
+                if failed:
+                    self.units[index].cache.invalidate(path)
+                acks[index, path] = not failed and result.get(path, False)
+        return acks
+
+    def move(self, unit, channel, register, value):
+        """Set a timing register (delay or width, in seconds) of a channel of a unit
+
+        Concurrent moves of the same unit are coalesced into one write, see BNC575.move
+
+        Parameters
+        ----------
+        unit: int or BNC575
+            Index of the unit in the group, or the unit itself
+
+        Returns
+        -------
+        bool: True if the unit acknowledged the new value
+        """
+        unit = self.units[unit] if isinstance(unit, int) else unit
+        return unit.move(channel, register, value)
+
+    def move_all(self, targets):
+        """Combined move of several units, returning once all of them settled
+
+        Parameters
+        ----------
+        targets: dict
+            Value in seconds of each (unit index, channel, register name), e.g. {(1, 2, 'delay'): 5e-9}
+
+        Returns
+        -------
+        bool: True if every unit acknowledged all its new values
+        """
+        values = {}
+        for (index, channel, name), value in targets.items():
+            register = REGISTERS[name]
+            values[index, register.paths[channel]] = register.render(value)[0]
+        return all(self.write_many(values).values())
+
+    def close(self):
+        for unit in self.units:
+            unit.group = None
+            unit.close()
+        self.units = []
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
@@ -0,0 +1,50 @@
+import threading
+
+
+class GroupCommit:
+    """Coalesce writes issued concurrently from several threads into batches
+
+    The first caller writes its value right away. Values submitted while that write is in flight,
+    e.g. by the other axes moving at the same time, are collected and written together by one of
+    their callers as soon as the write in flight is done, so that concurrent moves cost one round
+    trip instead of one each.
+
+    Parameters
+    ----------
+    flush: callable
+        Writes a dict of values and returns a dict with the acknowledgement of each of its keys
+    """
+
+    def __init__(self, flush):
+        self.flush = flush
+        self._values = {}
+        self._acks = {}
+        self._cond = threading.Condition()
+        self._writing = False
+        self._batch = 0
+        self._done = -1
+
+    def submit(self, key, value):
+        """Write value under key along with the other pending values, return its acknowledgement"""
+        with self._cond:
+            self._values[key] = value
+            batch = self._batch
+            while self._writing and self._done < batch:
+                self._cond.wait()
+            if self._done >= batch:  # written by another thread along with its own value
+                return self._acks.get(key, False)
+            values, self._values = self._values, {}
+            self._batch += 1
+            self._writing = True
+        acks = {}
+        try:
+            acks = self.flush(values)
+        finally:
+            with self._cond:
+                # a batch that failed or left keys unacknowledged must not return acks of an earlier batch
+                self._acks.update(dict.fromkeys(values, False))
+                self._acks.update(acks)
+                self._writing = False
+                self._done = batch
+                self._cond.notify_all()
+        return acks.get(key, False)
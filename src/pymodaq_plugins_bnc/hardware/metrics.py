@@ -0,0 +1,126 @@
+import bisect
+import threading
+import time
+from collections import Counter, deque
+
+
+class Histogram:
+    """Duration histogram with logarithmic buckets from 1 µs to 100 s, eight buckets per decade"""
+
+    BOUNDS = [10 ** (exponent / 8) for exponent in range(-48, 17)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of the samples, in seconds"""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        cumulated = 0
+        for index, count in enumerate(self.counts):
+            cumulated += count
+            if cumulated >= rank:
+                return min(self.BOUNDS[index] if index < len(self.BOUNDS) else self.max, self.max)
+        return self.max
+
+    def summary(self):
+        """Statistics of the recorded durations, in milliseconds"""
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1e3,
+            'p50_ms': self.percentile(0.5) * 1e3,
+            'p95_ms': self.percentile(0.95) * 1e3,
+            'min_ms': self.min * 1e3,
+            'max_ms': self.max * 1e3,
+        }
+
+
+class Metrics:
+    """Timing histograms, event counters and an optional trace of the exchanges of a Device
+
+    Each exchange is split in three phases: write (handing the command to the transport), wait
+    (until the reply line arrives and is decoded) and parse (handing the reply over to the caller).
+
+    Parameters
+    ----------
+    trace_size: int
+        Number of most recent exchanges kept in trace, 0 to disable the trace
+    """
+
+    def __init__(self, trace_size=0):
+        self._lock = threading.Lock()
+        self.trace_size = trace_size
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.write = Histogram()
+            self.wait = Histogram()
+            self.parse = Histogram()
+            self.commands = {}
+            self.counters = Counter()
+            self.trace = deque(maxlen=self.trace_size) if self.trace_size else None
+
+    def count(self, event, increment=1):
+        """Increment an event counter, e.g. reconnects, timeouts, connection_errors, error_replies"""
+        with self._lock:
+            self.counters[event] += increment
+
+    def record(self, msg, reply, sent, written, received, done):
+        """Record one exchange from its perf_counter timestamps"""
+        header = msg.split(" ", 1)[0]
+        with self._lock:
+            self.write.record(written - sent)
+            self.wait.record(received - written)
+            self.parse.record(done - received)
+            histogram = self.commands.get(header)
+            if histogram is None:
+                histogram = self.commands[header] = Histogram()
+            histogram.record(done - sent)
+            if self.trace is not None:
+                self.trace.append((time.time(), msg, reply, done - sent))
+
+    def summary(self):
+        """Snapshot of all metrics as a dictionary"""
+        with self._lock:
+            return {
+                'write': self.write.summary(),
+                'wait': self.wait.summary(),
+                'parse': self.parse.summary(),
+                'commands': {header: histogram.summary() for header, histogram in self.commands.items()},
+                'counters': dict(self.counters),
+            }
+
+    def report(self):
+        """Human readable table of the per command timings and the counters"""
+        summary = self.summary()
+        lines = [f"{'command':<24}{'count':>8}{'mean ms':>10}{'p95 ms':>10}{'max ms':>10}"]
+        for name in ('write', 'wait', 'parse'):
+            lines.append(self._report_line(f"[{name}]", summary[name]))
+        for header, stats in sorted(summary['commands'].items(), key=lambda item: -item[1]['count']):
+            lines.append(self._report_line(header, stats))
+        for event, count in sorted(summary['counters'].items()):
+            lines.append(f"{event:<24}{count:>8}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _report_line(name, stats):
+        if not stats['count']:
+            return f"{name:<24}{0:>8}"
+        return f"{name:<24}{stats['count']:>8}{stats['mean_ms']:>10.3f}{stats['p95_ms']:>10.3f}{stats['max_ms']:>10.3f}"
@@ -0,0 +1,104 @@
+import threading
+import time
+from pymodaq_plugins_bnc.hardware import get_logger
+
+logger = get_logger(__file__)
+
+
+class StatePoller:
+    """Background thread sampling settings of a BNC575 and signalling the ones that changed
+
+    Each sample is a single pipelined read_state() of the polled settings, sent as a background
+    exchange. Sampling is postponed while a foreground exchange (a move, a setting change) is in flight
+    or ended less than idle seconds ago, so that a poll batch is not queued ahead of a move on the wire.
+
+    Parameters
+    ----------
+    device: BNC575
+    names: iterable of str
+        Settings to sample, see BNC575.read_state
+    interval: float
+        Seconds between two samples
+    idle: float
+        Seconds without foreground exchange required before sampling
+    """
+
+    def __init__(self, device, names, interval=1.0, idle=0.2):
+        self.device = device
+        self.names = tuple(names)
+        self.interval = interval
+        self.idle = idle
+        self.hooks = []
+        self._listener = None
+        self.state = {}
+        self.reachable = True
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def listener(self):
+        """Qt signals of the poller (see signals.PollerListener), an adapter on the hooks created on first use"""
+        if self._listener is None:
+            from pymodaq_plugins_bnc.hardware.signals import PollerListener
+            self._listener = PollerListener()
+            self.hooks.append(self._listener.forward)
+        return self._listener
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self.state = {}
+        self._thread = threading.Thread(target=self._run, name="BNC575 state poller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not self._wait_idle():
+                return
+            self.poll()
+
+    def _wait_idle(self):
+        """Wait until no foreground exchange happened for idle seconds, False if stopped meanwhile"""
+        while True:
+            remaining = self.idle - (time.monotonic() - self.device.last_foreground)
+            if not self.device.busy and remaining <= 0:
+                return True
+            if self._stop.wait(max(remaining, self.idle / 10)):
+                return False
+
+    def poll(self):
+        """Sample the polled settings once and emit the ones that changed since the previous sample"""
+        try:
+            state = self.device.read_state(self.names, background=True)
+        except (ConnectionError, ValueError) as e:
+            logger.debug(f"State polling failed: {e}")
+            self._set_reachable(False)
+            return {}
+        self._set_reachable(True)
+        changes = {name: value for name, value in state.items() if self.state.get(name) != value}
+        self.state.update(state)
+        if changes:
+            self._notify('state_changed', changes)
+        return changes
+
+    def _set_reachable(self, reachable):
+        if reachable != self.reachable:
+            self.reachable = reachable
+            self._notify('reachable', reachable)
+
+    def _notify(self, event, *args):
+        """Call the hooks with an event: 'state_changed' with the changed settings, or 'reachable' with
+        True or False. Hooks are called in the polling thread."""
+        for hook in self.hooks:
+            hook(event, *args)
@@ -0,0 +1,57 @@
+"""
+Named configurations of the whole instrument, stored in the profiles table of the plugin configuration
+
+A profile is a nested dict: the system registers under 'system' and the registers of every channel under
+'channels', keyed by channel label, e.g.
+
+    {'system': {'period': 1e-3, 'trig_mode': 'TRIG', ...},
+     'channels': {'A': {'delay': 10e-9, 'width': 20e-9, 'polarity': 'NORM', ...}, 'B': {...}}}
+
+with the values in instrument units, as parsed by registers.Register. Profiles are captured with
+BNC575.capture_profile and applied with BNC575.apply_profile, and can be exchanged as TOML or JSON files.
+"""
+import json
+from pathlib import Path
+
+import toml
+
+# Registers making up a profile, in the order they are applied: the modes come before the values they enable
+PROFILE_SYSTEM = ('global_mode', 'period', 'trig_mode', 'trig_thresh', 'trig_edge', 'gate_mode', 'gate_thresh',
+                  'global_logic')
+PROFILE_CHANNEL = ('channel_state', 'channel_mode', 'delay', 'width', 'amplitude_mode', 'amplitude', 'polarity',
+                   'channel_gate', 'channel_logic')
+
+
+def profile_names(config):
+    """Names of the profiles stored in the plugin configuration"""
+    return list(config.to_dict().get('profiles', {}))
+
+
+def load_profile(config, name):
+    """Profile stored under name in the plugin configuration, raising ConfigError if there is none"""
+    profile = config('profiles', name)
+    return {'system': dict(profile.get('system', {})),
+            'channels': {label: dict(values) for label, values in profile.get('channels', {}).items()}}
+
+
+def save_profile(config, name, profile):
+    """Store a profile under name in the plugin configuration and write the configuration file"""
+    config[('profiles', name)] = profile
+    config.save()
+
+
+def export_profile(profile, path):
+    """Write a profile to a .json file, or to a TOML file for any other suffix"""
+    path = Path(path)
+    if path.suffix.lower() == '.json':
+        path.write_text(json.dumps(profile, indent=2))
+    else:
+        path.write_text(toml.dumps(profile))
+
+
+def import_profile(path):
+    """Read a profile written by export_profile"""
+    path = Path(path)
+    if path.suffix.lower() == '.json':
+        return json.loads(path.read_text())
+    return toml.loads(path.read_text())
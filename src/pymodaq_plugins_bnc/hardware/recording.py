@@ -0,0 +1,198 @@
+"""
+Record and replay of the traffic with the instruments, to reproduce field latencies offline
+
+A Recorder attached to a transport (see Device.record) logs every command with the time it was sent,
+the latency and the reply of the instrument, one JSON object per line:
+
+    {"t": 12.503121, "dev": "192.168.178.146:2001", "cmd": ":PULSE1:DELAY 0.000000010000", "dt": 0.000412, "reply": "ok"}
+
+reply is null for a command left without reply (timeout, or connection lost, see error). A ReplayTransport
+answers a BNC575 from such a recording, with the recorded latencies scaled by a speed factor, so that the
+driver and the plugin can be benchmarked deterministically without the instrument, e.g.
+
+    bnc = BNC575("192.168.178.146", 2001, replay="run.jsonl", replay_speed=10.0)
+"""
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future
+from pymodaq_plugins_bnc.hardware import get_logger
+from pymodaq_plugins_bnc.hardware.framing import error_for
+
+logger = get_logger(__file__)
+
+
+class Recorder:
+    """Append the exchanges of one or several transports to a JSON lines file
+
+    Each line is flushed as it is written, so a crash loses at most the exchanges in flight. Devices attach
+    to the recorder (see Device.record) and detach when they stop recording or close, the last one to
+    detach closes the file.
+
+    Parameters
+    ----------
+    path: str or Path
+        File to write, appended to if it exists
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8', buffering=1)
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._devices = set()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def attach(self, device):
+        """Record the exchanges of device from now on"""
+        with self._lock:
+            if self._file.closed:
+                raise ValueError(f"Recording to {self.path} is closed")
+            self._devices.add(device)
+        device._transport.recorder = self
+
+    def detach(self, device):
+        """Stop recording the exchanges of device, closing the file if it was the last one recorded"""
+        if device._transport.recorder is self:
+            device._transport.recorder = None
+        with self._lock:
+            self._devices.discard(device)
+            last = not self._devices
+        if last:
+            self.close()
+
+    def sent(self, transport, lines, futures):
+        """Record commands just written by transport, each once its future is done"""
+        sent = time.perf_counter()
+        device = f"{transport.ip}:{transport.port}"
+        for line, future in zip(lines, futures):
+            future.add_done_callback(
+                lambda future, command=line.strip().decode(errors="replace"): self._write(device, command, sent, future))
+
+    def _write(self, device, command, sent, future):
+        entry = {'t': round(sent - self._start, 6), 'dev': device, 'cmd': command, 'dt': None, 'reply': None}
+        if not future.cancelled():
+            error = future.exception()
+            if error is None:
+                entry['reply'] = future.result().decode(errors="replace")
+            elif getattr(error, 'reply', None) is not None:
+                entry['reply'] = error.reply
+            else:
+                entry['error'] = str(error)
+            if hasattr(future, 'received'):
+                entry['dt'] = round(future.received - sent, 6)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(json.dumps(entry) + "\n")
+
+    def close(self):
+        """Close the file, detaching the devices still recording to it"""
+        with self._lock:
+            devices, self._devices = self._devices, set()
+            self._file.close()
+        for device in devices:
+            if device._transport.recorder is self:
+                device._transport.recorder = None
+
+
+def load_recording(path, device=None):
+    """Entries of a recording, in the order the commands were sent, only those of device ('ip:port') if given"""
+    with open(path, encoding='utf-8') as file:
+        entries = [json.loads(line) for line in file if line.strip()]
+    entries = [entry for entry in entries if device is None or entry['dev'] == device]
+    return sorted(entries, key=lambda entry: entry['t'])
+
+
+class ReplayTransport:
+    """Transport answering the commands of a device with the replies of a recording
+
+    Each command gets the next recorded reply to the same command, or the last one when the recording has
+    no more, so that a driver sending its commands in a different order or number still gets consistent
+    replies. A command never recorded gets the ?3 invalid keyword error and is counted in unmatched.
+    Replies arrive in order, after the recorded latency divided by speed.
+
+    Parameters
+    ----------
+    recording: str or Path or list of dict
+        Recording file, or entries from load_recording
+    ip: str
+    port: int
+        Address of the device whose entries are replayed
+    speed: float
+        Factor applied to the replay rate, e.g. 10 to replay ten times faster, 0 to answer at once
+    loop: asyncio.AbstractEventLoop or None
+        Loop resolving the replies, the shared one from get_event_loop() by default
+    """
+
+    def __init__(self, recording, ip, port, speed=1.0, loop=None):
+        from pymodaq_plugins_bnc.hardware.transport import get_event_loop
+        device = f"{ip}:{port}"
+        if isinstance(recording, list):
+            entries = [entry for entry in recording if entry['dev'] == device]
+        else:
+            entries = load_recording(recording, device)
+        self.ip = ip
+        self.port = port
+        self.speed = speed
+        self.loop = loop if loop is not None else get_event_loop()
+        self.listeners = []
+        self.recorder = None
+        self.unmatched = 0
+        self._replies = defaultdict(deque)
+        for entry in entries:
+            self._replies[entry['cmd']].append((entry['dt'], entry['reply']))
+        self._last = {}
+        self._due = 0.0
+        self._open = False
+
+    @property
+    def connected(self):
+        return self._open
+
+    async def open(self):
+        self._open = True
+
+    async def close(self):
+        self._open = False
+
+    def _next(self, command):
+        replies = self._replies.get(command)
+        if replies:
+            self._last[command] = replies.popleft()
+        elif command not in self._last:
+            self.unmatched += 1
+            return 0.0, "?3"
+        return self._last[command]
+
+    async def submit(self, lines):
+        """Return the futures of the replies to command lines, resolved after their recorded latency"""
+        if not self._open:
+            await self.open()
+        futures = [Future() for _ in lines]
+        now = self.loop.time()
+        for line, future in zip(lines, futures):
+            command = line.strip().decode(errors="replace")
+            latency, reply = self._next(command)
+            if reply is None:  # recorded without reply, left to time out
+                continue
+            due = now + (latency or 0.0) / self.speed if self.speed else now
+            self._due = max(self._due, due)
+            self.loop.call_at(self._due, self._resolve, future, reply, command)
+        if self.recorder is not None:
+            self.recorder.sent(self, lines, futures)
+        return futures
+
+    @staticmethod
+    def _resolve(future, reply, command):
+        if future.done():
+            return
+        future.received = time.perf_counter()
+        error = error_for(reply.encode(), command)
+        if error is None:
+            future.set_result(reply.encode())
+        else:
+            future.set_exception(error)
@@ -0,0 +1,188 @@
+"""
+Register table of the BNC575, from which the BNC575 properties, the plugin parameters and the batched
+queries are generated
+
+Every register is described once, with its SCPI path, type, limits and write format. The path, query
+string and encoded query line of every channel are rendered when the table is built, so reading a
+register allocates no command string.
+"""
+
+CHANNELS = {"A": 1, "B": 2, "C": 3, "D": 4}
+
+_STATES = {True: "ON", False: "OFF", "ON": "ON", "OFF": "OFF", "1": "ON", "0": "OFF"}
+_STATE_REPLIES = {"ON": "1", "OFF": "0"}
+
+
+class Register:
+    """Declarative description of an instrument register, usable as a property of BNC575
+
+    Parameters
+    ----------
+    name: str
+        Attribute of BNC575 and name of the plugin parameter
+    path: str
+        SCPI path, with a {channel} field for registers of a channel
+    kind: str
+        'bool' for ON/OFF states, 'list' for a choice among limits, 'float' or 'str'
+    title: str
+        Title of the plugin parameter
+    units: str or None
+        Units of the value on the instrument side
+    limits: list or tuple or None
+        Choices of a 'list' register, (min, max) of a 'float' one, in instrument units
+    fmt: str
+        Format of a written value
+    default: object
+        Default value shown in the plugin
+    scale: float
+        Factor from the instrument units to the plugin units, e.g. 1e9 for durations shown in ns
+    readonly: bool
+        True for registers that can only be queried
+    resolution: float or None
+        Step of the values the instrument can set, written values are rounded to it
+    """
+
+    def __init__(self, name, path, kind, title, units=None, limits=None, fmt="{}", default=None, scale=1.0,
+                 readonly=False, resolution=None):
+        self.name = name
+        self.path = path
+        self.kind = kind
+        self.title = title
+        self.units = units
+        self.limits = limits
+        self.fmt = fmt
+        self.default = default
+        self.scale = scale
+        self.readonly = readonly
+        self.resolution = resolution
+        self.scope = 'channel' if '{channel}' in path else 'global'
+        # precompiled forms, indexed by channel number (the same for every index for global registers)
+        self.paths = tuple(path.format(channel=channel) for channel in range(5))
+        self.queries = tuple(f"{path}?" for path in self.paths)
+        self.lines = tuple(f"{path}?\r\n".encode() for path in self.paths)
+
+    def __repr__(self):
+        return f"Register({self.name!r}, {self.path!r})"
+
+    def render(self, value):
+        """Value as written on the instrument and as it replies to a query of the register"""
+        if self.kind == 'bool':
+            state = _STATES[value]
+            return state, _STATE_REPLIES[state]
+        if self.resolution is not None:
+            value = round(value / self.resolution) * self.resolution
+        text = self.fmt.format(value)
+        return text, text
+
+    def validate(self, value):
+        """Raise ValueError if value can not be written to the register"""
+        if self.readonly:
+            raise ValueError(f"{self.name} is read only")
+        if self.kind == 'bool':
+            valid = value in _STATES
+        elif self.kind == 'list':
+            valid = value in self.limits
+        elif self.kind == 'float':
+            valid = isinstance(value, (int, float)) and (self.limits is None or
+                                                          self.limits[0] <= value <= self.limits[1])
+        else:
+            valid = isinstance(value, str)
+        if not valid:
+            limits = f", expected {self.limits}" if self.limits is not None else ""
+            raise ValueError(f"Invalid {self.name} {value!r}{limits}")
+
+    def parse(self, reply):
+        """Python value of a reply to a query of the register"""
+        if self.kind == 'bool':
+            return reply == "1"
+        if self.kind == 'float':
+            return float(reply)
+        return reply
+
+    @property
+    def initial(self):
+        """Value shown in the plugin before the register is read"""
+        if self.default is not None:
+            return self.default
+        if self.kind == 'bool':
+            return False
+        if self.kind == 'list':
+            return self.limits[0]
+        return 0.0 if self.kind == 'float' else ""
+
+    def parameter(self, value, name=None):
+        """Definition of the plugin parameter showing this register with the given value"""
+        param = {'title': self.title, 'name': name or self.name}
+        if self.kind == 'bool':
+            param.update(type='led_push', value=value)
+        elif self.kind == 'list':
+            param.update(type='list', value=value, limits=list(self.limits))
+        elif self.kind == 'float':
+            param.update(type='float', value=value * self.scale)
+            if self.default is not None:
+                param['default'] = self.default * self.scale
+            if self.limits is not None:
+                param.update(min=self.limits[0] * self.scale, max=self.limits[1] * self.scale)
+        else:
+            param.update(type='str', value=value)
+        if self.readonly:
+            param['readonly'] = True
+        return param
+
+    def __get__(self, device, owner=None):
+        if device is None:
+            return self
+        channel = device.set_channel()
+        return self.parse(device._read(self.paths[channel], self.lines[channel]))
+
+    def __set__(self, device, value):
+        if self.readonly:
+            raise AttributeError(f"{self.name} is read only")
+        text, reply = self.render(value)
+        device._write(self.paths[device.set_channel()], text, reply)
+
+
+_MODES = ("NORM", "SING", "BURS", "DCYC")
+# Durations are set in steps of 250 ps, written with enough decimals to keep them (and as the instrument replies)
+RESOLUTION = 250e-12
+_DURATION = "{:.12f}"
+
+REGISTERS = {register.name: register for register in (
+    Register('id', "*IDN", 'str', 'Controller', readonly=True),
+    Register('label', "*LBL", 'str', 'Configuration Label', fmt='"{}"'),
+    Register('global_state', ":INST:STATE", 'bool', 'Global State'),
+    Register('global_mode', ":PULSE0:MODE", 'list', 'Global Mode', limits=_MODES),
+    Register('channel_mode', ":PULSE{channel}:CMOD", 'list', 'Channel Mode', limits=_MODES),
+    Register('channel_state', ":PULSE{channel}:STATE", 'bool', 'Channel State'),
+    Register('width', ":PULSE{channel}:WIDT", 'float', 'Width (ns)', 's', (10e-9, 999.0), _DURATION, 10e-9, 1e9,
+             resolution=RESOLUTION),
+    Register('delay', ":PULSE{channel}:DELAY", 'float', 'Delay (ns)', 's', (0.0, 999.0), _DURATION, 0.0, 1e9,
+             resolution=RESOLUTION),
+    Register('amplitude_mode', ":PULSE{channel}:OUTP:MODE", 'list', 'Amplitude Mode', limits=("ADJ", "TTL")),
+    Register('amplitude', ":PULSE{channel}:OUTP:AMPL", 'float', 'Amplitude (V)', 'V', (2.0, 20.0), default=2.0),
+    Register('polarity', ":PULSE{channel}:POL", 'list', 'Polarity', limits=("NORM", "COMP", "INV")),
+    Register('period', ":PULSE0:PER", 'float', 'Period (s)', 's', (100e-9, 5000.0), default=1e-3),
+    Register('trig_mode', ":PULSE0:TRIG:MODE", 'list', 'Trigger Mode', limits=("DIS", "TRIG")),
+    Register('trig_thresh', ":PULSE0:TRIG:LEV", 'float', 'Trigger Threshold (V)', 'V', (0.2, 15.0), default=2.5),
+    Register('trig_edge', ":PULSE0:TRIG:EDGE", 'list', 'Trigger Edge', limits=("RIS", "FALL")),
+    Register('gate_mode', ":PULSE0:GATE:MODE", 'list', 'Global Gate Mode', limits=("DIS", "PULS", "OUTP", "CHAN")),
+    Register('gate_thresh', ":PULSE0:GATE:LEV", 'float', 'Gate Threshold (V)', 'V', (0.2, 15.0), default=2.5),
+    Register('global_logic', ":PULSE0:GATE:LOGIC", 'list', 'Gate Logic', limits=("HIGH", "LOW")),
+    Register('channel_gate', ":PULSE{channel}:CGATE", 'list', 'Channel Gate Mode', limits=("DIS", "PULS", "OUTP")),
+    Register('channel_logic', ":PULSE{channel}:CLOGIC", 'list', 'Gate Logic', limits=("HIGH", "LOW")),
+)}
+
+# Settings shown in the plugin: the registers they read, in order, and the register describing their parameter.
+# channel_gate_mode and gate_logic depend on the global gate mode, see BNC575.
+SETTINGS = {name: ((name,), name) for name in REGISTERS if name not in ('global_logic', 'channel_gate', 'channel_logic')}
+SETTINGS['channel_gate_mode'] = (('gate_mode', 'channel_gate'), 'channel_gate')
+SETTINGS['gate_logic'] = (('gate_mode', 'channel_logic', 'global_logic'), 'channel_logic')
+
+# Settings holding the value of a channel register, which change when another channel is selected
+CHANNEL_SETTINGS = tuple(name for name, (registers, _) in SETTINGS.items()
+                         if any(REGISTERS[register].scope == 'channel' for register in registers))
+
+
+def initial_state():
+    """Value of every setting shown before the instrument state is read, see Register.initial"""
+    return {name: REGISTERS[register].initial for name, (_, register) in SETTINGS.items()}
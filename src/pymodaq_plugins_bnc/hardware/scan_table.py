@@ -0,0 +1,61 @@
+import bisect
+
+
+class ScanTable:
+    """Delay list of a sequenced scan, with the command of every point rendered ahead of time
+
+    The BNC575 has no memory for a list of delays, so the table lives on the client: each point is a
+    single pre-encoded write armed right after the previous acquisition, so that the next trigger
+    (external, or a *TRG pipelined in the same write) fires with the next delay. The current position
+    is tracked by a local index and never read back from the instrument.
+
+    Parameters
+    ----------
+    trajectory: Trajectory
+        Validated delays of the scanned channels and their rendered commands
+    channel: int or None
+        Channel whose delay is the position of the scan, the first channel of the trajectory by default
+    """
+
+    def __init__(self, trajectory, channel=None):
+        self.trajectory = trajectory
+        self.channel = trajectory.channels[0] if channel is None else channel
+        column = trajectory.channels.index(self.channel)
+        self.delays = trajectory.delays[:, column].tolist()
+        self.values = [row[column] for row in trajectory.values]
+        self.index = -1
+        self._sorted = sorted((delay, index) for index, delay in enumerate(self.delays))
+
+    def commands(self, index):
+        """Commands and their encoded lines arming a point, only the changed delays when stepping forward"""
+        trajectory = self.trajectory
+        if index == self.index + 1 and self.index >= 0:
+            return trajectory.steps[index], trajectory.step_lines[index]
+        return trajectory.commands[index], trajectory.lines[index]
+
+    def __len__(self):
+        return len(self.delays)
+
+    @property
+    def position(self):
+        """Delay of the current point in seconds, None before the first step"""
+        return self.delays[self.index] if self.index >= 0 else None
+
+    def lookup(self, delay, tolerance=0.0):
+        """Return the index of the point closest to delay, or None if none is within tolerance
+
+        Points after the current one are preferred, so that a scan visiting the same delay twice
+        keeps stepping forward.
+        """
+        following = self.index + 1
+        if following < len(self.delays) and abs(self.delays[following] - delay) <= tolerance:
+            return following
+        position = bisect.bisect_left(self._sorted, (delay, -1))
+        candidates = self._sorted[max(position - 1, 0):position + 1]
+        if not candidates:
+            return None
+        closest_delay, index = min(candidates, key=lambda item: abs(item[0] - delay))
+        return index if abs(closest_delay - delay) <= tolerance else None
+
+    def reset(self):
+        self.index = -1
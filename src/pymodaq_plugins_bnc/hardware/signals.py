@@ -0,0 +1,23 @@
+"""
+Qt adapter of the driver hooks, imported on first use of Device.listener or StatePoller.listener only
+
+The driver notifies its events to plain Python hooks (see Device.hooks and StatePoller.hooks). A listener
+re-emits them as Qt signals, so that the plugin receives them in its own thread through queued connections.
+"""
+from qtpy.QtCore import QObject, Signal
+
+
+class _Listener(QObject):
+    def forward(self, event, *args):
+        """Hook emitting the signal named after the event"""
+        getattr(self, event).emit(*args)
+
+
+class DeviceListener(_Listener):
+    ok_received = Signal()
+    still_communicating = Signal(bool)
+
+
+class PollerListener(_Listener):
+    state_changed = Signal(dict)
+    reachable = Signal(bool)
@@ -0,0 +1,276 @@
+"""
+TCP simulator of a BNC575 delay generator, implementing the SCPI subset used by bnc_commands.py
+
+Run it standalone with::
+
+    python -m pymodaq_plugins_bnc.hardware.simulator --port 2001 --latency 0.002 --jitter 0.001
+
+or in process with::
+
+    with BNC575Simulator(latency=0.002) as sim:
+        bnc = BNC575(*sim.address)
+"""
+import argparse
+import asyncio
+import copy
+import random
+import threading
+
+IDN = "BNC,575-4,SIM0000,2.4.2-2.0.11"
+
+# Error replies of the instrument
+INVALID_KEYWORD = "?3"
+MISSING_PARAMETER = "?4"
+INVALID_PARAMETER = "?5"
+QUERY_ONLY = "?6"
+
+_STATE = {"ON": "1", "OFF": "0", "1": "1", "0": "0"}
+
+
+def _choice(*choices):
+    def convert(value):
+        value = value.upper()
+        if value not in choices:
+            raise ValueError(value)
+        return value
+    return convert
+
+
+def _number(low, high):
+    def convert(value):
+        number = float(value)
+        if not low <= number <= high:
+            raise ValueError(value)
+        return number
+    return convert
+
+
+def _state(value):
+    return _STATE[value.upper()]
+
+
+def _seconds(value):
+    return f"{value:.12f}"
+
+
+def _volts(value):
+    return f"{value:.2f}"
+
+
+# register: (parser of a written value, formatter of a queried value, default value)
+SYSTEM_REGISTERS = {
+    ":INST:STATE": (_state, str, "0"),
+    ":PULSE0:MODE": (_choice("NORM", "SING", "BURS", "DCYC"), str, "NORM"),
+    ":PULSE0:PER": (_number(100e-9, 5000.0), _seconds, 1e-3),
+    ":PULSE0:TRIG:MODE": (_choice("DIS", "TRIG"), str, "DIS"),
+    ":PULSE0:TRIG:LEV": (_number(0.2, 15.0), _volts, 2.5),
+    ":PULSE0:TRIG:EDGE": (_choice("RIS", "FALL"), str, "RIS"),
+    ":PULSE0:GATE:MODE": (_choice("DIS", "PULS", "OUTP", "CHAN"), str, "DIS"),
+    ":PULSE0:GATE:LEV": (_number(0.2, 15.0), _volts, 2.5),
+    ":PULSE0:GATE:LOGIC": (_choice("HIGH", "LOW"), str, "HIGH"),
+}
+
+CHANNEL_REGISTERS = {
+    "STATE": (_state, str, "0"),
+    "CMOD": (_choice("NORM", "SING", "BURS", "DCYC"), str, "NORM"),
+    "DELAY": (_number(-999.99999999975, 999.99999999975), _seconds, 0.0),
+    "WIDT": (_number(10e-9, 999.99999999975), _seconds, 10e-9),
+    "POL": (_choice("NORM", "COMP", "INV"), str, "NORM"),
+    "OUTP:MODE": (_choice("ADJ", "TTL"), str, "TTL"),
+    "OUTP:AMPL": (_number(2.0, 20.0), _volts, 4.0),
+    "CGATE": (_choice("DIS", "PULS", "OUTP"), str, "DIS"),
+    "CLOGIC": (_choice("HIGH", "LOW"), str, "HIGH"),
+}
+
+REGISTERS = dict(SYSTEM_REGISTERS)
+for _channel in range(1, 5):
+    REGISTERS.update({f":PULSE{_channel}:{name}": register for name, register in CHANNEL_REGISTERS.items()})
+
+
+class BNC575Simulator:
+    """In-memory BNC575 answering SCPI commands over TCP
+
+    Parameters
+    ----------
+    host: str
+    port: int
+        TCP port to listen on, 0 to pick a free one (see address once started)
+    latency: float
+        Delay in seconds before each reply
+    jitter: float
+        Random extra delay in seconds, drawn uniformly between 0 and jitter for each reply
+    drop_rate: float
+        Probability for each command to have its connection dropped instead of being answered
+    seed: int or None
+        Seed of the random generator driving jitter and drops
+
+    Setting drop_next to N drops the connection on each of the next N commands.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, drop_rate=0.0, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.drop_next = 0
+        self.random = random.Random(seed)
+        self.registers = {}
+        self.slots = {}
+        self.label = ""
+        self.commands = 0
+        self.triggers = 0
+        self._server = None
+        self._clients = set()
+        self._loop = None
+        self._thread = None
+        self.reset()
+
+    @property
+    def address(self):
+        return self.host, self.port
+
+    def reset(self):
+        self.registers = {path: default for path, (_, _, default) in REGISTERS.items()}
+        self.label = ""
+
+    def handle(self, command):
+        """Apply a single SCPI command to the simulated state and return its reply"""
+        self.commands += 1
+        command = command.strip()
+        header, _, argument = command.partition(" ")
+        header = header.upper()
+        argument = argument.strip()
+        if header.endswith("?"):
+            return self._query(header[:-1])
+        if header == "*RST":
+            self.reset()
+            return "ok"
+        if header == "*TRG":
+            self.triggers += 1
+            return "ok"
+        if header in ("*SAV", "*RCL", "*LBL") and not argument:
+            return MISSING_PARAMETER
+        if header == "*SAV":
+            self.slots[argument] = (copy.deepcopy(self.registers), self.label)
+            return "ok"
+        if header == "*RCL":
+            if argument in self.slots:
+                registers, self.label = self.slots[argument]
+                self.registers = copy.deepcopy(registers)
+            else:
+                self.reset()
+            return "ok"
+        if header == "*LBL":
+            self.label = argument.strip('"')
+            return "ok"
+        if header == "*IDN":
+            return QUERY_ONLY
+        if header not in REGISTERS:
+            return INVALID_KEYWORD
+        if not argument:
+            return MISSING_PARAMETER
+        parser = REGISTERS[header][0]
+        try:
+            self.registers[header] = parser(argument)
+        except (KeyError, ValueError):
+            return INVALID_PARAMETER
+        return "ok"
+
+    def _query(self, header):
+        if header == "*IDN":
+            return IDN
+        if header == "*LBL":
+            return f'"{self.label}"'
+        if header not in REGISTERS:
+            return INVALID_KEYWORD
+        return REGISTERS[header][1](self.registers[header])
+
+    async def _serve_client(self, reader, writer):
+        self._clients.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if self.drop_next:
+                    self.drop_next -= 1
+                    break
+                if self.drop_rate and self.random.random() < self.drop_rate:
+                    break
+                delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+                if delay:
+                    await asyncio.sleep(delay)
+                reply = self.handle(line.decode(errors="replace"))
+                writer.write((reply + "\r\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    async def serve(self):
+        """Listen for connections, to be awaited on a running event loop"""
+        self._server = await asyncio.start_server(self._serve_client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self._server
+
+    def start(self):
+        """Run the simulator in a background thread, return its (host, port) address"""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="BNC575 simulator", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self.serve(), self._loop).result()
+        return self.address
+
+    def stop(self):
+        if self._loop is None:
+            return
+
+        async def shutdown():
+            self._server.close()
+            for writer in list(self._clients):
+                writer.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated BNC575 delay generator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2001)
+    parser.add_argument("--latency", type=float, default=0.0, help="reply delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra reply delay in seconds")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="probability to drop the connection")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    simulator = BNC575Simulator(args.host, args.port, args.latency, args.jitter, args.drop_rate, args.seed)
+
+    async def run():
+        server = await simulator.serve()
+        print(f"BNC575 simulator listening on {simulator.host}:{simulator.port}", flush=True)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
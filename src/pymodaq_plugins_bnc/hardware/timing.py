@@ -0,0 +1,111 @@
+import numpy as np
+from pymodaq_plugins_bnc.hardware.registers import CHANNELS, REGISTERS
+
+LABELS = tuple(CHANNELS)
+# Margin for the rounding of sums of durations, well below the timing resolution
+_TOLERANCE = REGISTERS['delay'].resolution / 10
+
+
+class TimingModel:
+    """Pulses of the four channels within the period, for one configuration or many at once
+
+    Every array has the channels on its last axis, in the order A to D, and any leading shape, e.g.
+    (points, 4) for the configurations of a whole scan, so that edges, overlaps and violations of all
+    the points are computed in one vectorized pass. Values are in seconds.
+
+    Parameters
+    ----------
+    delays, widths: array_like
+        Delay and width of each channel, of shape (..., 4)
+    period: float or array_like or None
+        Pulse period, of shape (...), None for triggered pulses without period constraint
+    enabled: bool or array_like
+        State of each channel, disabled channels are never in violation nor overlapping
+    """
+
+    def __init__(self, delays, widths, period=None, enabled=True):
+        self.delays = np.asarray(delays, dtype=float)
+        self.widths = np.broadcast_to(np.asarray(widths, dtype=float), self.delays.shape)
+        self.period = None if period is None else np.broadcast_to(np.asarray(period, dtype=float), self.shape)
+        self.enabled = np.broadcast_to(np.asarray(enabled, dtype=bool), self.delays.shape)
+
+    @classmethod
+    def from_profile(cls, profile):
+        """Model of a profile, see profiles.py"""
+        channels = [profile['channels'][label] for label in LABELS]
+        return cls([channel['delay'] for channel in channels], [channel['width'] for channel in channels],
+                   profile['system'].get('period'), [channel['channel_state'] for channel in channels])
+
+    @property
+    def shape(self):
+        return self.delays.shape[:-1]
+
+    @property
+    def rising(self):
+        return self.delays
+
+    @property
+    def falling(self):
+        return self.delays + self.widths
+
+    def with_delays(self, delays, channels):
+        """Model of a scan: this configuration with the delays of some channels replaced at each point
+
+        The scanned channels are checked whether they are enabled or not.
+
+        Parameters
+        ----------
+        delays: array_like
+            Delays of shape (points, len(channels))
+        channels: sequence of int
+            Channel number (1 to 4) of each column of delays
+        """
+        delays = np.asarray(delays, dtype=float).reshape(-1, len(channels))
+        columns = [channel - 1 for channel in channels]
+        scan = np.repeat(self.delays[None, :], len(delays), axis=0)
+        scan[:, columns] = delays
+        enabled = np.array(self.enabled)
+        enabled[columns] = True  # the scanned channels are checked even if they are switched on later
+        return TimingModel(scan, self.widths, self.period, enabled)
+
+    def overlaps(self):
+        """Array of shape (..., 4, 4), True where the pulses of two enabled channels are high together"""
+        rising, falling = self.rising, self.falling
+        both = self.enabled[..., :, None] & self.enabled[..., None, :]
+        overlap = (rising[..., :, None] < falling[..., None, :]) & (rising[..., None, :] < falling[..., :, None])
+        return overlap & both & ~np.eye(4, dtype=bool)
+
+    def violations(self):
+        """Boolean arrays of shape (..., 4) of the channels breaking each constraint
+
+        delay and width: outside the limits of their register, period: pulse ending after the period
+        """
+        result = {}
+        for name, values in (('delay', self.delays), ('width', self.widths)):
+            low, high = REGISTERS[name].limits
+            result[name] = ((values < low - _TOLERANCE) | (values > high + _TOLERANCE)) & self.enabled
+        if self.period is None:
+            result['period'] = np.zeros(self.delays.shape, dtype=bool)
+        else:
+            result['period'] = (self.falling > self.period[..., None] + _TOLERANCE) & self.enabled
+        return result
+
+    def invalid(self):
+        """Array of shape (...), True for the configurations breaking any constraint"""
+        return np.logical_or.reduce([violation.any(axis=-1) for violation in self.violations().values()])
+
+    def describe(self, index=()):
+        """Text of the violations of one configuration, e.g. model.describe(12) for the 13th scan point"""
+        messages = []
+        for name, violation in self.violations().items():
+            for channel in np.flatnonzero(violation[index]):
+                delay, width = self.delays[index][channel], self.widths[index][channel]
+                if name == 'period':
+                    period = self.period[index]
+                    messages.append(f"{LABELS[channel]}: pulse ends at {(delay + width) * 1e9:g} ns, after the "
+                                    f"{period * 1e9:g} ns period")
+                else:
+                    low, high = REGISTERS[name].limits
+                    value = delay if name == 'delay' else width
+                    messages.append(f"{LABELS[channel]}: {name} {value * 1e9:g} ns outside [{low * 1e9:g}, {high * 1e9:g}] ns")
+        return messages
@@ -0,0 +1,99 @@
+import numpy as np
+from pymodaq_plugins_bnc.hardware.registers import REGISTERS
+
+
+class Trajectory:
+    """Delays of a whole scan, validated and rendered to commands in one vectorized pass
+
+    The delays are rounded to the timing resolution of the instrument and clamped to the delay limits
+    and, when a period is given, so that each pulse ends within the period (delay + width <= period).
+    Consecutive points left identical by the rounding are merged, and stepping from a point to the next
+    only writes the channels whose delay changed. The commands of every point are rendered ahead of
+    time, text and encoded, so that stepping through the scan does no math nor validation.
+
+    Parameters
+    ----------
+    delays: array_like
+        Delays in seconds, of shape (points,) for one channel or (points, channels)
+    channels: int or sequence of int
+        Channel number (1 to 4) of each column of delays
+    period: float or None
+        Pulse period in seconds, None to skip the period constraint
+    widths: float or sequence of float or None
+        Pulse width in seconds of each channel, used with period
+    bounds: tuple of float or None
+        Lowest and highest delay in seconds, the delay register limits by default
+    resolution: float or None
+        Timing resolution in seconds, the one of the delay register by default
+
+    Attributes
+    ----------
+    delays: ndarray
+        Validated delays, of shape (points, channels)
+    requested: ndarray
+        Index in the input of each point kept
+    clamped: int
+        Number of input points moved by the clamping
+    merged: int
+        Number of input points dropped as identical to the previous one
+    values: list of list of str
+        Rendered delay of each channel at each point
+    commands: list of list of str
+        Commands setting every channel to each point
+    steps: list of list of str
+        Commands going to each point from the previous one
+    lines, step_lines: list of list of bytes
+        commands and steps of each point, encoded
+    """
+
+    def __init__(self, delays, channels, period=None, widths=None, bounds=None, resolution=None):
+        register = REGISTERS['delay']
+        self.channels = (channels,) if np.isscalar(channels) else tuple(channels)
+        resolution = register.resolution if resolution is None else resolution
+        low, high = register.limits if bounds is None else bounds
+
+        requested = np.asarray(delays, dtype=float).reshape(-1, len(self.channels))
+        quantized = np.round(requested / resolution) * resolution
+        high = np.full(len(self.channels), high, dtype=float)
+        if period is not None:
+            widths = np.broadcast_to(np.asarray(0.0 if widths is None else widths, dtype=float), high.shape)
+            high = np.minimum(high, np.floor((period - widths) / resolution) * resolution)
+        validated = np.clip(quantized, low, high)
+        self.clamped = int(np.count_nonzero((validated != quantized).any(axis=1)))
+
+        kept = np.ones(len(validated), dtype=bool)
+        kept[1:] = (validated[1:] != validated[:-1]).any(axis=1)
+        self.delays = validated[kept]
+        self.requested = np.flatnonzero(kept)
+        self.merged = len(validated) - len(self.delays)
+
+        changed = np.ones(self.delays.shape, dtype=bool)
+        changed[1:] = self.delays[1:] != self.delays[:-1]
+        paths = [register.paths[channel] for channel in self.channels]
+        self.values = [[register.fmt.format(delay) for delay in row] for row in self.delays.tolist()]
+        self.commands = [[f"{path} {value}" for path, value in zip(paths, row)] for row in self.values]
+        self.steps = [[commands[column] for column in np.flatnonzero(mask)]
+                      for commands, mask in zip(self.commands, changed)]
+        self.lines = [self._encode(commands) for commands in self.commands]
+        self.step_lines = [self._encode(commands) for commands in self.steps]
+
+    def __len__(self):
+        return len(self.delays)
+
+    @staticmethod
+    def _encode(commands):
+        return [(command + "\r\n").encode() for command in commands]
+
+    @classmethod
+    def linear(cls, start, stop, step, channels, **kwargs):
+        """Evenly spaced delays from start to stop included, for every channel"""
+        delays = np.arange(start, stop + step / 2, step)
+        return cls(np.repeat(delays[:, None], 1 if np.isscalar(channels) else len(channels), axis=1),
+                   channels, **kwargs)
+
+    @classmethod
+    def log(cls, start, stop, points, channels, **kwargs):
+        """Logarithmically spaced delays from start to stop included, for every channel, start > 0"""
+        delays = np.geomspace(start, stop, points)
+        return cls(np.repeat(delays[:, None], 1 if np.isscalar(channels) else len(channels), axis=1),
+                   channels, **kwargs)
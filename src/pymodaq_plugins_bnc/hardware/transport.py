@@ -0,0 +1,333 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from pymodaq_plugins_bnc.hardware import get_logger
+from pymodaq_plugins_bnc.hardware.framing import ReplyFramer, error_for
+
+logger = get_logger(__file__)
+
+_loop = None
+_loop_lock = threading.Lock()
+
+# Commands that must not be written twice when replaying after a connection loss
+NON_IDEMPOTENT = (b"*TRG",)
+
+
+def get_event_loop():
+    """Return the event loop shared by every instrument connection
+
+    The loop runs forever in a daemon thread started on first use, so all devices and their in-flight
+    commands are multiplexed on one thread instead of one blocking reader per device. A process forked
+    from one using the loop, e.g. a multiprocessing worker, starts its own loop and connections.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="BNC event loop", daemon=True).start()
+        return _loop
+
+
+def is_idempotent(line):
+    """True if writing this command line a second time leaves the instrument in the same state"""
+    return not line.lstrip().upper().startswith(NON_IDEMPOTENT)
+
+
+class AsyncTransport:
+    """Line oriented TCP connection to an instrument, driven by the shared event loop
+
+    Replies come back in the order the commands were written, so every command gets a future queued
+    in _pending and the reader task resolves the oldest one as soon as its reply line arrives. These
+    are concurrent.futures.Future objects so that callers on any thread can wait on them. A future holds
+    the reply line as bytes, or the DeviceError matching an error reply of the instrument.
+
+    When the connection drops, it is reopened with a bounded exponential backoff and the commands still
+    waiting for a reply are written again once, except the non idempotent ones (see NON_IDEMPOTENT) which
+    fail with a ConnectionError. TCP keepalive is enabled on the socket and, if health_interval is set,
+    an idle connection is probed with *IDN? so that a dead link is noticed before the next command.
+
+    Parameters
+    ----------
+    ip: str
+    port: int
+    connect_timeout: float
+        Seconds allowed for each attempt to establish the TCP connection
+    max_retries: int
+        Connection attempts after the first one before giving up
+    backoff: tuple of float
+        Initial and maximal delay in seconds between two connection attempts
+    health_interval: float or None
+        Idle time in seconds after which the connection is probed, None to disable probing
+    loop: asyncio.AbstractEventLoop or None
+        Loop running the connection, the shared one from get_event_loop() by default
+    """
+
+    def __init__(self, ip, port, connect_timeout=5.0, max_retries=5, backoff=(0.05, 2.0), health_interval=30.0,
+                 loop=None):
+        self.ip = ip
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.health_interval = health_interval
+        self.loop = loop if loop is not None else get_event_loop()
+        self.listeners = []
+        self.recorder = None  # recording.Recorder logging the exchanges, see Device.record
+        self.last_activity = time.monotonic()
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._health_task = None
+        self._open_lock = None
+        self._pending = deque()
+        self._replay = []
+
+    @property
+    def connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    def _notify(self, event):
+        for listener in self.listeners:
+            listener(event)
+
+    async def open(self):
+        """Connect, retrying with exponential backoff, and write again the commands to replay"""
+        if self._open_lock is None:
+            self._open_lock = asyncio.Lock()
+        async with self._open_lock:
+            if self.connected:
+                return
+            delay, max_delay = self.backoff
+            for attempt in range(self.max_retries + 1):
+                try:
+                    reader, writer = await asyncio.wait_for(asyncio.open_connection(self.ip, self.port),
+                                                            self.connect_timeout)
+                    break
+                except (OSError, asyncio.TimeoutError) as e:
+                    if attempt == self.max_retries:
+                        replay, self._replay = self._replay, []
+                        for future, _ in replay:
+                            if not future.done():
+                                future.set_exception(ConnectionError(str(e)))
+                        raise ConnectionError(f"Could not connect to {self.ip}:{self.port}: {e}") from e
+                    self._notify('retries')
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, max_delay)
+            sock = writer.get_extra_info('socket')
+            if sock is not None:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            self._reader, self._writer = reader, writer
+            self._reader_task = asyncio.ensure_future(self._read_replies(reader))
+            if self.health_interval and self._health_task is None:
+                self._health_task = asyncio.ensure_future(self._check_health())
+            replay, self._replay = [item for item in self._replay if not item[0].done()], []
+            if replay:
+                self._pending.extend(replay)
+                writer.write(b"".join(line for _, line in replay))
+                logger.info(f"Replayed {len(replay)} commands to {self.ip}:{self.port} after reconnection")
+
+    async def close(self):
+        writer, self._writer = self._writer, None
+        self._reader = None
+        for task in (self._reader_task, self._health_task):
+            if task is not None:
+                task.cancel()
+        self._reader_task = None
+        self._health_task = None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+        self._fail_pending(ConnectionError("Connection to device closed"))
+        replay, self._replay = self._replay, []
+        for future, _ in replay:
+            if not future.done():
+                future.set_exception(ConnectionError("Connection to device closed"))
+
+    async def submit(self, lines):
+        """Write command lines and return the futures that will hold their replies, in order"""
+        if not self.connected:
+            await self.open()
+        futures = [Future() for _ in lines]
+        self._pending.extend(zip(futures, lines))
+        self._writer.write(b"".join(lines))
+        self.last_activity = time.monotonic()
+        if self.recorder is not None:
+            self.recorder.sent(self, lines, futures)
+        return futures
+
+    async def _read_replies(self, reader):
+        framer = ReplyFramer()
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    raise ConnectionError("Connection closed by the device")
+                for line in framer.feed(data):
+                    self._resolve(line)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if reader is self._reader:
+                self._connection_lost(e)
+
+    def _connection_lost(self, error):
+        logger.warning(f"Connection to {self.ip}:{self.port} lost: {error}")
+        self._notify('reconnects')
+        writer, self._writer = self._writer, None
+        self._reader = None
+        if writer is not None:
+            writer.close()
+        pending, self._pending = self._pending, deque()
+        for future, line in pending:
+            if future.done():
+                continue
+            if is_idempotent(line) and not getattr(future, 'replayed', False):
+                future.replayed = True
+                self._replay.append((future, line))
+            else:
+                future.set_exception(ConnectionError(f"Connection lost before the reply to {line!r}"))
+        asyncio.ensure_future(self._reopen())
+
+    async def _reopen(self):
+        try:
+            await self.open()
+        except ConnectionError as e:
+            logger.error(str(e))
+
+    async def _check_health(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            if time.monotonic() - self.last_activity < self.health_interval or not self.connected:
+                continue
+            if self._pending:
+                continue
+            try:
+                probe = await self.submit([b"*IDN?\r\n"])
+                await asyncio.wait_for(asyncio.wrap_future(probe[0]), self.connect_timeout)
+            except (asyncio.TimeoutError, OSError):
+                if self._reader is not None:
+                    self._connection_lost(ConnectionError("Health check probe got no reply"))
+
+    def _resolve(self, line):
+        self.last_activity = time.monotonic()
+        try:
+            future, command = self._pending.popleft()
+        except IndexError:
+            logger.debug(f"Unsolicited reply from device: {line!r}")
+            return
+        if future.cancelled():  # late reply to a request that already timed out
+            return
+        future.received = time.perf_counter()
+        error = error_for(line, command.strip().decode(errors="replace"))
+        try:
+            if error is None:
+                future.set_result(line)
+            else:
+                future.set_exception(error)
+        except Exception:  # cancelled between the check and the result
+            pass
+
+    def _fail_pending(self, error):
+        while self._pending:
+            future, _ = self._pending.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+
+class ConnectionPool:
+    """Persistent transports shared across plugin re-initializations, keyed by (ip, port)
+
+    A transport released by its last user is kept open for linger seconds, so that rebuilding a
+    controller on the same address reuses the socket instead of reconnecting.
+
+    Parameters
+    ----------
+    linger: float
+        Seconds an unused connection is kept open
+    """
+
+    def __init__(self, linger=60.0):
+        self.linger = linger
+        self._lock = threading.Lock()
+        self._transports = {}
+        self._users = {}
+        self._closers = {}
+
+    def acquire(self, ip, port, **kwargs):
+        """Return the transport to (ip, port), creating it with kwargs if there is none"""
+        key = (ip, port)
+        with self._lock:
+            transport = self._transports.get(key)
+            if transport is None:
+                transport = self._transports[key] = AsyncTransport(ip, port, **kwargs)
+                self._users[key] = 0
+            self._users[key] += 1
+            closer = self._closers.pop(key, None)
+        if closer is not None:
+            transport.loop.call_soon_threadsafe(closer.cancel)
+        return transport
+
+    def release(self, transport):
+        key = (transport.ip, transport.port)
+        with self._lock:
+            if self._transports.get(key) is not transport:
+                return
+            self._users[key] -= 1
+            if self._users[key] > 0:
+                return
+        transport.loop.call_soon_threadsafe(self._schedule_close, key, transport)
+
+    def _schedule_close(self, key, transport):
+        with self._lock:
+            if self._users.get(key):
+                return
+            self._closers[key] = transport.loop.call_later(self.linger, self._expire, key, transport)
+
+    def _expire(self, key, transport):
+        with self._lock:
+            if self._users.get(key) or self._transports.get(key) is not transport:
+                return
+            del self._transports[key]
+            del self._users[key]
+            self._closers.pop(key, None)
+        asyncio.ensure_future(transport.close())
+
+    def forget(self):
+        """Drop every transport without closing it, for a forked child process which does not own them"""
+        self._lock = threading.Lock()
+        self._transports = {}
+        self._users = {}
+        self._closers = {}
+
+    def close_all(self):
+        with self._lock:
+            transports = list(self._transports.values())
+            self._transports.clear()
+            self._users.clear()
+            closers, self._closers = list(self._closers.values()), {}
+        for transport in transports:
+            asyncio.run_coroutine_threadsafe(transport.close(), transport.loop).result()
+        for closer in closers:
+            get_event_loop().call_soon_threadsafe(closer.cancel)
+
+
+pool = ConnectionPool()
+
+
+def _after_fork():
+    """Forget the loop thread and the connections of the parent process, which a forked child does not have"""
+    global _loop, _loop_lock
+    _loop = None
+    _loop_lock = threading.Lock()
+    pool.forget()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,413 @@
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from pymodaq_plugins_bnc.hardware.bnc_commands import BNC575
+from pymodaq_plugins_bnc.hardware.debounce import DebouncedWriter
+from pymodaq_plugins_bnc.hardware.framing import InvalidParameter, ReplyFramer, parse_number
+from pymodaq_plugins_bnc.hardware.group import BNC575Group
+from pymodaq_plugins_bnc.hardware.group_commit import GroupCommit
+from pymodaq_plugins_bnc.hardware.poller import StatePoller
+from pymodaq_plugins_bnc.hardware.recording import load_recording
+from pymodaq_plugins_bnc.hardware import simulator as simulator_module
+from pymodaq_plugins_bnc.hardware.simulator import BNC575Simulator
+from pymodaq_plugins_bnc.hardware.trajectory import Trajectory
+
+
+@pytest.fixture
+def simulator():
+    with BNC575Simulator() as sim:
+        yield sim
+
+
+@pytest.fixture
+def bnc(simulator):
+    controller = BNC575(*simulator.address)
+    yield controller
+    controller.close()
+
+
+def test_idn(bnc):
+    assert bnc.idn().startswith("BNC,575")
+
+
+def test_set_and_read_back(bnc, simulator):
+    bnc.delay = 12.5e-9
+    bnc.width = 20.1e-9
+    assert bnc.delay == pytest.approx(12.5e-9)
+    bnc.trust_cache = False
+    assert bnc.delay == pytest.approx(12.5e-9)
+    assert bnc.width == pytest.approx(20e-9)
+    assert simulator.registers[":PULSE1:DELAY"] == pytest.approx(12.5e-9)
+
+
+def test_cache_skips_the_wire(bnc, simulator):
+    bnc.delay = 1e-9
+    commands = simulator.commands
+    for _ in range(10):
+        assert bnc.delay == pytest.approx(1e-9)
+    assert simulator.commands == commands
+
+
+def test_reset_invalidates_cache(bnc, simulator):
+    bnc.delay = 5e-9
+    bnc.reset()
+    assert bnc.delay == 0.0
+
+
+def test_save_and_restore(bnc):
+    bnc.delay = 7e-9
+    bnc.slot = 3
+    bnc.save_state()
+    bnc.delay = 1e-9
+    bnc.restore_state()
+    assert bnc.delay == pytest.approx(7e-9)
+
+
+def test_read_state(bnc):
+    bnc.channel_label = "C"
+    bnc.gate_mode = "CHAN"
+    bnc.channel_gate_mode = "PULS"
+    state = bnc.read_state()
+    assert state['id'].startswith("BNC,575")
+    assert state['period'] == pytest.approx(1e-3)
+    assert state['gate_mode'] == "CHAN"
+    assert state['channel_gate_mode'] == "PULS"
+
+
+def test_read_state_subset(bnc, simulator):
+    commands = simulator.commands
+    state = bnc.read_state(('delay', 'channel_gate_mode', 'gate_logic'))
+    assert set(state) == {'delay', 'channel_gate_mode', 'gate_logic'}
+    assert simulator.commands - commands == 5  # the global gate mode is queried once
+
+
+def test_concurrent_moves_are_coalesced(bnc):
+    threads = [threading.Thread(target=bnc.move, args=(channel, 'delay', channel * 1e-9))
+               for channel in range(1, 5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    bnc.trust_cache = False
+    assert [bnc.channel_value(channel, 'delay') for channel in range(1, 5)] == \
+        pytest.approx([1e-9, 2e-9, 3e-9, 4e-9])
+
+
+def test_failed_batch_is_not_acknowledged():
+    batches = []
+    in_flight = threading.Event()
+    release = threading.Event()
+
+    def flush(values):
+        batches.append(values)
+        if len(batches) == 2:
+            in_flight.set()
+            release.wait()
+        elif len(batches) == 3:
+            raise ConnectionError("Connection to device closed")
+        return dict.fromkeys(values, True)
+
+    commit = GroupCommit(flush)
+    assert commit.submit('a', 1) and commit.submit('c', 1)
+    writer = threading.Thread(target=commit.submit, args=('b', 2))
+    writer.start()
+    in_flight.wait()
+    outcomes = []
+
+    def move(key):
+        try:
+            outcomes.append(commit.submit(key, 3))
+        except ConnectionError:
+            outcomes.append('failed')
+
+    waiters = [threading.Thread(target=move, args=(key,)) for key in ('a', 'c')]
+    for waiter in waiters:
+        waiter.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in [writer] + waiters:
+        thread.join()
+    assert batches[2] == {'a': 3, 'c': 3}
+    assert sorted(outcomes, key=str) == [False, 'failed']
+
+
+def test_dropped_connection_reconnects(simulator, bnc):
+    simulator.drop_rate = 1.0
+    assert bnc.send("*IDN?") == ''
+    simulator.drop_rate = 0.0
+    assert bnc.send("*IDN?").startswith("BNC,575")
+
+
+def test_metrics(bnc):
+    assert bnc.metrics is None
+    metrics = bnc.enable_metrics(trace_size=2)
+    bnc.idn()
+    bnc.send(":PULSE1:FOO?")
+    summary = metrics.summary()
+    assert summary['commands']['*IDN?']['count'] == 1
+    assert summary['counters']['error_replies'] == 1
+    assert len(metrics.trace) == 2
+    bnc.disable_metrics()
+    bnc.send("*IDN?")
+    assert metrics.summary()['commands']['*IDN?']['count'] == 1
+
+
+def test_pending_queries_are_replayed_after_a_drop(simulator, bnc):
+    simulator.drop_next = 1
+    assert bnc.send("*IDN?").startswith("BNC,575")
+
+
+def test_triggers_are_not_replayed(simulator, bnc):
+    simulator.drop_next = 1
+    futures = bnc.submit_many(["*TRG"])
+    with pytest.raises(ConnectionError):
+        futures[0].result(timeout=3)
+    assert bnc.send("*IDN?").startswith("BNC,575")
+    assert simulator.triggers == 0
+
+
+def test_connections_are_pooled(simulator):
+    first = BNC575(*simulator.address)
+    transport = first._transport
+    first.close()
+    second = BNC575(*simulator.address)
+    assert second._transport is transport
+    second.close()
+
+
+def test_poller_emits_changes_only(bnc, simulator):
+    poller = StatePoller(bnc, ('global_state', 'delay'))
+    changes = []
+    poller.listener.state_changed.connect(changes.append)
+    assert set(poller.poll()) == {'global_state', 'delay'}
+    assert poller.poll() == {}
+    simulator.registers[":PULSE1:DELAY"] = 3e-9
+    assert poller.poll() == {'delay': pytest.approx(3e-9)}
+    assert len(changes) == 2
+
+
+def test_poller_yields_to_foreground(bnc):
+    poller = StatePoller(bnc, ('delay',), idle=0.3)
+    bnc.idn()
+    start = time.monotonic()
+    assert poller._wait_idle()
+    assert time.monotonic() - start > 0.2
+
+
+def test_register_properties(bnc, simulator):
+    bnc.channel_label = "B"
+    bnc.channel_state = "ON"
+    bnc.polarity = "INV"
+    bnc.label = "scan"
+    bnc.trust_cache = False
+    assert bnc.channel_state is True
+    assert bnc.polarity == "INV"
+    assert bnc.label == '"scan"'
+    assert simulator.registers[":PULSE2:STATE"] == "1"
+    replies = bnc.read_registers(['delay', 'polarity'], channel=2)
+    assert replies == {'delay': '0.000000000000', 'polarity': 'INV'}
+
+
+def test_framer_splits_replies():
+    framer = ReplyFramer()
+    assert framer.feed(b"ok\r\n0.0000000") == [b"ok"]
+    assert framer.feed(b"12000\r\n?5\r\n1") == [b"0.000000012000", b"?5"]
+    assert len(framer) == 1
+    assert parse_number(b"0.000000012000") == pytest.approx(12e-9)
+    with pytest.raises(InvalidParameter):
+        parse_number(b"?5")
+
+
+def test_error_replies_raise(bnc):
+    with pytest.raises(InvalidParameter):
+        bnc.period = 1e-9
+    assert bnc.send(":PULSE0:PER 1e-9") == "?5"
+
+
+def test_group_moves_units_in_parallel():
+    with BNC575Simulator(latency=0.1) as first, BNC575Simulator(latency=0.1) as second:
+        group = BNC575Group([first.address, second.address])
+        try:
+            start = time.perf_counter()
+            assert group.move_all({(0, 1, 'delay'): 3e-9, (1, 2, 'width'): 20e-9})
+            assert time.perf_counter() - start < 0.18
+            assert first.registers[":PULSE1:DELAY"] == pytest.approx(3e-9)
+            assert second.registers[":PULSE2:WIDT"] == pytest.approx(20e-9)
+            assert group[1].channel_value(2, 'width') == pytest.approx(20e-9)
+            assert group.move(group[1], 1, 'delay', 4e-9)
+        finally:
+            group.close()
+
+
+def test_trajectory_is_quantized_clamped_and_merged():
+    trajectory = Trajectory([[0.1e-9, 5e-9], [0.12e-9, 5e-9], [1.3e-9, 5e-9], [2e-6, 6e-9]], (1, 2),
+                            period=1e-6, widths=[10e-9, 10e-9])
+    assert trajectory.delays[:, 0] == pytest.approx([0.0, 1.25e-9, 990e-9])
+    assert trajectory.merged == 1
+    assert trajectory.clamped == 1
+    assert trajectory.steps[1] == [":PULSE1:DELAY 0.000000001250"]
+    assert len(trajectory.commands[1]) == 2
+
+
+def test_scan_table_steps(bnc, simulator):
+    table = bnc.load_scan_table(Trajectory.linear(0.0, 2e-9, 0.5e-9, (1, 3)))
+    assert len(table) == 5
+    for index in range(len(table)):
+        assert bnc.step(trigger=True)
+    assert simulator.triggers == 5
+    assert simulator.registers[":PULSE3:DELAY"] == pytest.approx(2e-9)
+    assert table.position == pytest.approx(2e-9)
+
+
+def test_verified_read_catches_divergence(bnc, simulator):
+    metrics = bnc.enable_metrics()
+    assert bnc.move(1, 'delay', 4e-9)
+    commands = simulator.commands
+    assert bnc.channel_value(1, 'delay') == pytest.approx(4e-9)
+    assert simulator.commands == commands
+    simulator.registers[":PULSE1:DELAY"] = 6e-9
+    assert bnc.channel_value(1, 'delay', verify=True) == pytest.approx(6e-9)
+    assert metrics.summary()['counters']['divergences'] == 1
+
+
+def test_profile_applies_minimal_diff(bnc, simulator, tmp_path):
+    from pymodaq_plugins_bnc.hardware.profiles import export_profile, import_profile
+    bnc.channel_label = "B"
+    bnc.delay = 3e-9
+    bnc.channel_state = True
+    profile = bnc.capture_profile()
+    assert profile['channels']['B']['delay'] == pytest.approx(3e-9)
+    assert profile['channels']['B']['channel_state'] is True
+    for suffix in ('.toml', '.json'):
+        export_profile(profile, tmp_path / f"profile{suffix}")
+        assert import_profile(tmp_path / f"profile{suffix}") == profile
+
+    assert bnc.apply_profile(profile) == {}  # nothing differs from the cache
+    bnc.delay = 8e-9
+    bnc.channel_state = False
+    profile['channels']['D']['width'] = 40e-9
+    commands = simulator.commands
+    acks = bnc.apply_profile(profile)
+    assert simulator.commands - commands == 3
+    assert all(acks.values())
+    assert simulator.registers[":PULSE2:DELAY"] == pytest.approx(3e-9)
+    assert bnc.apply_profile(profile) == {}
+
+
+def test_driver_is_headless(simulator):
+    script = ("import sys\n"
+              "from pymodaq_plugins_bnc.hardware.group import BNC575Group\n"
+              "from pymodaq_plugins_bnc.hardware.poller import StatePoller\n"
+              f"group = BNC575Group([{simulator.address!r}], background_connect=True)\n"
+              "events = []\n"
+              "group.master.hooks.append(lambda event, *args: events.append(event))\n"
+              "poller = StatePoller(group.master, ('delay',))\n"
+              "poller.hooks.append(lambda event, *args: events.append(event))\n"
+              "group.master.delay = 5e-9\n"
+              "poller.poll()\n"
+              "group.close()\n"
+              "assert events[:3] == ['still_communicating', 'ok_received', 'still_communicating']\n"
+              "assert events[-1] == 'state_changed'\n"
+              "assert not [name for name in sys.modules if name.startswith(('qtpy', 'PyQt', 'PySide', 'pymodaq.'))]\n")
+    subprocess.run([sys.executable, "-c", script], check=True, timeout=30)
+
+
+def test_debounced_writes_keep_the_last_value(bnc, simulator):
+    writer = DebouncedWriter(bnc.write_registers, delay=0.05)
+    events = []
+    writer.hooks.append(lambda event, *args: events.append((event, *args)))
+    commands = simulator.commands
+    for step in range(100):
+        writer.submit(('delay', 2), step * 1e-9)
+        writer.submit(('period', 0), 1e-3 + step * 1e-6)
+    assert writer.pending == {('delay', 2), ('period', 0)}
+    deadline = time.monotonic() + 2
+    while events[-1] != ('pending', False) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    writer.close()
+    assert simulator.commands - commands == 2
+    assert simulator.registers[":PULSE2:DELAY"] == pytest.approx(99e-9)
+    assert [event[0] for event in events] == ['pending', 'written', 'pending']
+    assert all(events[1][2].values())
+
+
+def test_transaction_orders_validates_and_rolls_back(bnc, monkeypatch):
+    with pytest.raises(ValueError):
+        bnc.transaction({'amplitude': 5.0, 'amplitude_mode': "TTL"})
+    with pytest.raises(ValueError):
+        bnc.transaction({'width': 1e-12})
+    written = bnc.transaction({'amplitude': 5.0, 'amplitude_mode': "ADJ", 'rep_rate': 2e3,
+                               'channel_gate_mode': "PULS", 'gate_logic': "LOW"})
+    assert list(written) == [":PULSE1:OUTP:MODE", ":PULSE1:OUTP:AMPL", ":PULSE0:PER", ":PULSE0:GATE:MODE",
+                             ":PULSE1:CGATE", ":PULSE1:CLOGIC"]
+    assert bnc.transaction({'amplitude': 5.0, ('delay', 3): 0.0}) == {}
+
+    # an instrument accepting a narrower range than the register table
+    monkeypatch.setitem(simulator_module.REGISTERS, ":PULSE0:TRIG:LEV", (simulator_module._number(0.2, 5.0), str, 2.5))
+    with pytest.raises(InvalidParameter):
+        bnc.transaction({'period': 2e-3, 'trig_thresh': 10.0})
+    bnc.trust_cache = False
+    assert bnc.period == pytest.approx(0.5e-3)
+
+
+def test_scan_breaking_the_timing_is_rejected(bnc, simulator):
+    bnc.channel_label = "B"
+    bnc.width = 1e-6
+    bnc.channel_label = "A"
+    bnc.channel_state = True
+    model = bnc.timing_model()
+    assert not model.invalid()
+    assert model.with_delays([0.0, 999.5e-6], [2]).invalid().tolist() == [False, True]
+    commands = simulator.commands
+    with pytest.raises(ValueError, match="1 of 3 scan points"):
+        bnc.load_scan_table(Trajectory([0.0, 1e-6, 999.5e-6], 2))
+    assert bnc.scan_table is None
+    assert simulator.commands == commands  # the state was cached, nothing was written
+    assert len(bnc.load_scan_table([0.0, 1e-6, 999.5e-6], channel=2)) == 3  # clamped within the period
+
+
+def test_streamed_moves_collect_errors_at_the_barrier(bnc, simulator):
+    acks = []
+    for step in range(50):
+        bnc.move_nowait(1, 'delay', step * 1e-9, acks.append)
+    bnc.move_nowait(1, 'width', 1e-12, acks.append)  # below the instrument minimum
+    with pytest.raises(InvalidParameter):
+        bnc.barrier()
+    assert acks == [True] * 50 + [False]
+    assert simulator.registers[":PULSE1:DELAY"] == pytest.approx(49e-9)
+    assert not bnc.busy
+    bnc.barrier()  # errors are reported once
+
+    bnc.load_scan_table([1e-9, 2e-9, 3e-9])
+    futures = [bnc.step_nowait() for _ in range(3)]
+    bnc.barrier()
+    assert [future.result() for future in futures] == [[], [], []]
+    assert bnc.delay == pytest.approx(3e-9)
+
+
+def test_recorded_session_replays_offline(simulator, tmp_path):
+    path = tmp_path / "session.jsonl"
+    bnc = BNC575(*simulator.address)
+    recorder = bnc.record(path)
+    bnc.delay = 5e-9
+    state = bnc.read_state()
+    with pytest.raises(InvalidParameter):
+        bnc.width = 1e-12
+    assert load_recording(path)[0]['cmd'] == ":PULSE1:DELAY 0.000000005000"  # flushed as recorded
+    bnc.close()
+    assert recorder.closed
+    recorded = load_recording(path)
+    assert recorded[-1]['reply'] == "?5" and all(entry['dt'] > 0 for entry in recorded)
+    BNC575(*simulator.address).close()  # same pooled connection, not recorded
+    assert load_recording(path) == recorded
+
+    replayed = BNC575(*simulator.address, replay=path, replay_speed=0)
+    assert replayed.read_state() == state
+    with pytest.raises(InvalidParameter):
+        replayed.width = 1e-12
+    assert replayed._transport.unmatched == 0
+    replayed.close()